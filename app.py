@@ -1,18 +1,52 @@
 from __future__ import annotations
 
 import os
+import sys
+import atexit
 import uuid
 import math
+import json
+import queue
+import base64
+import bisect
+import glob
+import hashlib
+import heapq
+import itertools
 import random
+import re
+import threading
+import unicodedata
+import zlib
+import time
+import multiprocessing
+import runpy
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
+from functools import wraps
 from datetime import datetime, timezone, timedelta, date
-from typing import Optional
+from typing import NamedTuple, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 from dotenv import load_dotenv
-from flask import Flask, render_template, request, redirect, url_for, make_response, jsonify
+from flask import Flask, Response, abort, copy_current_request_context, has_request_context, render_template, request, redirect, session, url_for, make_response, jsonify
 from flask_sqlalchemy import SQLAlchemy
-from PIL import Image
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateTable
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from thumbs import PERMANENT_ERRORS, make_variants
+
+try:
+    from gevent import get_hub as gevent_hub, monkey as gevent_monkey
+except ImportError:   # only the gevent worker (see Procfile) needs it
+    gevent_monkey = None
+
 load_dotenv()
 
 # -----------------------------
@@ -48,6 +82,106 @@ HOT_HALF_LIFE_HOURS = 12.0         # time-decay half-life
 HOT_LIKE_WEIGHT = 1.0
 HOT_DISLIKE_WEIGHT = 1.25
 HOT_BASE = 1.0
+HOT_EPOCH = datetime(2025, 1, 1)   # rank offset origin (naive UTC)
+HOT_RANK_FLOOR = -1.0e6            # net-zero tips; net-negative ones rank below, positive ones above
+FEED_PAGE_SIZE = 50
+FEED_CACHE_MAX_KEYS = 512        # (tab, tag) first pages kept per worker
+TAGS_PER_TIP = 10
+TAG_MAX_LEN = 40
+
+# Trending tags (decayed per-tag counters, same half-life idea as hot_rank)
+TREND_HALF_LIFE_HOURS = float(os.getenv("TREND_HALF_LIFE_HOURS", str(HOT_HALF_LIFE_HOURS)))
+TREND_W_SUBMIT = 1.0
+TREND_W_LIKE = 0.5                 # first like per user per tip
+TREND_FLUSH_S = float(os.getenv("TREND_FLUSH_S", "10"))   # pending deltas -> tag_trend
+TREND_CACHE_S = 30.0
+TREND_TOP_K = 12
+TREND_MIN = 0.5                    # decayed value below which a tag is no longer "trending"
+
+# Tag autocomplete (per-worker sorted name list)
+TAG_SUGGEST_LIMIT = 8
+TAG_SUGGEST_SYNC_S = 5.0           # pick up tags created by other workers
+TAG_SUGGEST_RELOAD_S = 300.0       # refresh use counts from the DB
+
+# Search (SQLite FTS5 when available, LIKE otherwise)
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_OFFSET = 1000                                         # deepest page served
+SEARCH_WINDOW = int(os.getenv("SEARCH_WINDOW", "5000"))          # newest matches that get ranked; 0 = all
+SEARCH_HOT_WEIGHT = float(os.getenv("SEARCH_HOT_WEIGHT", "1.0"))  # bm25 units per hot-rank unit (one half-life)
+FTS_TOKENIZE = os.getenv("FTS_TOKENIZE", "unicode61 remove_diacritics 2")   # "trigram" for CJK substrings
+WRITE_RETRIES = 5                  # retries when SQLite is busy or a concurrent vote wins
+
+# Single-writer mode (off by default): each worker hands its writes to one
+# thread that commits them in batches; read-only routes use mode=ro connections.
+SINGLE_WRITER = os.getenv("SINGLE_WRITER", "0") == "1"
+WRITE_BATCH_MAX = int(os.getenv("WRITE_BATCH_MAX", "64"))         # calls per transaction
+WRITE_BATCH_WAIT_MS = float(os.getenv("WRITE_BATCH_WAIT_MS", "0"))  # linger for more calls; 0 = take what has queued
+
+# Write-behind vote counters (off by default): vote rows are written at once,
+# tip counts and author points are batched per worker.
+VOTE_WRITE_BEHIND = os.getenv("VOTE_WRITE_BEHIND", "0") == "1"
+VOTE_FLUSH_MS = int(os.getenv("VOTE_FLUSH_MS", "250"))
+VOTE_FLUSH_EVENTS = int(os.getenv("VOTE_FLUSH_EVENTS", "200"))
+FEED_CACHE_TTL = float(os.getenv("FEED_CACHE_TTL", "5"))  # seconds; ranked first page per tab
+
+# Background thumbnails (DB-backed job queue, drained by a process pool per worker)
+THUMB_WORKERS = int(os.getenv("THUMB_WORKERS", "2"))
+THUMB_QUEUE_MAX = int(os.getenv("THUMB_QUEUE_MAX", "500"))      # beyond this, tips show the original
+THUMB_MAX_ATTEMPTS = 3
+THUMB_JOB_TIMEOUT_S = 120                                        # reclaim jobs from dead workers
+THUMB_POLL_S = 1.0
+THUMB_SIZES = "(max-width: 520px) calc(100vw - 60px), (max-width: 980px) 110px, 140px"   # matches .thumb in app.css
+
+# Near-duplicate images (64-bit dHash split into four indexed 16-bit bands)
+PHASH_MAX_DIST = int(os.getenv("PHASH_MAX_DIST", "6"))   # hamming distance still counted as a repost
+
+# Already-posted hints (canonical links + MinHash LSH over titles, per worker)
+TITLE_BACKFILL_MAX = int(os.getenv("TITLE_BACKFILL_MAX", "20000"))   # existing tips banded by the migration
+TITLE_MINHASH_PERMS = 64
+TITLE_LSH_BANDS = 16                                             # 4 rows per band: ~50% Jaccard threshold
+TITLE_SIM_MIN = 0.5
+TITLE_CANDIDATES = 50                                            # most band matches first, then exact Jaccard
+
+# SQLite connection profile, applied to every new connection (ignored on other databases)
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL").upper()        # readers never wait on the writer
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()       # durable at checkpoints under WAL
+SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "MEMORY").upper()
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))   # wait for the write lock, then "locked"
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "256"))
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", "64"))                   # page cache per connection
+
+# Postgres connection pool, per worker process, sized so that all gunicorn
+# workers together stay under DB_MAX_CONNECTIONS
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))          # gunicorn workers; gunicorn reads it too
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "90"))   # headroom under Postgres' default 100
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "0"))                # 0 = half of this worker's share
+DB_POOL_TIMEOUT_S = float(os.getenv("DB_POOL_TIMEOUT_S", "10"))
+DB_POOL_RECYCLE_S = int(os.getenv("DB_POOL_RECYCLE_S", "1800"))   # below typical proxy/LB idle timeouts
+
+# Archival: tips this old can no longer reach Hot (2^-14 of a fresh tip's
+# weight at 14 half-lives) and move to archived_tip with their final counts
+ARCHIVE_AFTER_HOURS = float(os.getenv("ARCHIVE_AFTER_HOURS", str(HOT_HALF_LIFE_HOURS * 14)))
+ARCHIVE_CHUNK = int(os.getenv("ARCHIVE_CHUNK", "500"))             # tips per transaction
+ARCHIVE_PAUSE_MS = int(os.getenv("ARCHIVE_PAUSE_MS", "50"))        # between chunks, so writers get in
+ARCHIVE_INTERVAL_S = float(os.getenv("ARCHIVE_INTERVAL_S", "0"))   # per-worker thread; 0 = CLI only
+
+# Per-worker user snapshot cache (signed session -> user row)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "2048"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))   # bounds staleness across workers
+
+# Tailing tables by "id > last seen" (stream events, new tags)
+TAIL_GAP_S = 30.0                  # how long a skipped id may still commit (Postgres sequences)
+TAIL_GAP_MAX = 1000                # skipped ids remembered per tail
+
+# Live stream (SSE)
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "100"))          # events buffered per connection
+SSE_HEARTBEAT_S = float(os.getenv("SSE_HEARTBEAT_S", "15"))
+SSE_POLL_MS = int(os.getenv("SSE_POLL_MS", "500"))                 # event-log tail interval per worker
+SSE_MAX_CLIENTS = int(os.getenv("SSE_MAX_CLIENTS", "0"))           # per worker; 0 = 900 under gevent, 24 under threads
+STREAM_URL = os.getenv("STREAM_URL", "").rstrip("/")              # base of the gevent stream process; "" = same origin
+SSE_RETRY_AFTER_S = 30                                             # sent with 503 when a worker is full
+SSE_MAX_IDS = 500
+SSE_EVENT_TTL_S = 600
 
 # -----------------------------
 # i18n
@@ -71,6 +205,10 @@ def _base():
         "submit": "Submit",
         "need_title": "Please enter a title.",
         "need_link_or_image": "Please provide a link or an image.",
+        "already_posted": "Already posted",
+        "clear_tag": "Show all tips",
+        "trending_tags": "Trending tags",
+        "similar_posts": "Similar posts",
         "login_ph": "handle (no password)",
         "password_ph": "password (set on first login)",
         "login": "Login",
@@ -105,6 +243,8 @@ def _base():
         "link_label": "Link",
         "image_label": "Image URL",
         "no_image": "No image",
+        "repost_of": "Repost of",
+        "archived": "Archived",
         "tab_hot": "Hot",
         "tab_new": "New",
         "checkin": "Check-in",
@@ -141,6 +281,10 @@ I18N = {
         "submit": "送信",
         "need_title": "タイトルを入力してください。",
         "need_link_or_image": "リンクまたは画像を追加してください。",
+        "already_posted": "投稿済み",
+        "clear_tag": "すべて表示",
+        "trending_tags": "急上昇タグ",
+        "similar_posts": "似た投稿",
         "login_ph": "ハンドル（パスワード不要）",
         "password_ph": "パスワード（初回で設定）",
         "login": "ログイン",
@@ -166,6 +310,8 @@ I18N = {
         "tab_new": "新着",
         "checkin": "チェックイン",
         "checked_in": "完了",
+        "repost_of": "再投稿",
+        "archived": "アーカイブ済み",
         "toast_checkin_done": "チェックイン完了！",
         "toast_checkin_already": "本日は完了しています。",
         "streak": "連続",
@@ -189,6 +335,10 @@ I18N = {
         "submit": "提交",
         "need_title": "请输入标题。",
         "need_link_or_image": "请提供链接或图片。",
+        "already_posted": "已有人发布",
+        "clear_tag": "显示全部",
+        "trending_tags": "热门标签",
+        "similar_posts": "相似线索",
         "login_ph": "昵称（无需密码）",
         "password_ph": "密码（首次登录设置）",
         "login": "登录",
@@ -214,6 +364,8 @@ I18N = {
         "tab_new": "最新",
         "checkin": "签到",
         "checked_in": "已签",
+        "repost_of": "重复发布",
+        "archived": "已归档",
         "toast_checkin_done": "签到成功！",
         "toast_checkin_already": "今天已签到。",
         "streak": "连续",
@@ -236,6 +388,10 @@ I18N = {
         "submit": "등록",
         "need_title": "제목을 입력해줘.",
         "need_link_or_image": "링크 또는 이미지를 추가해줘.",
+        "already_posted": "이미 올라온 제보",
+        "clear_tag": "전체 보기",
+        "trending_tags": "급상승 태그",
+        "similar_posts": "비슷한 제보",
         "login_ph": "핸들 (비번 없음)",
         "password_ph": "비밀번호 (첫 로그인 설정)",
         "login": "로그인",
@@ -270,6 +426,8 @@ I18N = {
         "link_label": "링크",
         "image_label": "이미지URL",
         "no_image": "이미지 없음",
+        "repost_of": "재게시",
+        "archived": "보관됨",
         "tab_hot": "핫",
         "tab_new": "최신",
         "checkin": "출석",
@@ -289,11 +447,77 @@ I18N = {
 # -----------------------------
 # App / DB
 # -----------------------------
+def database_url() -> str:
+    # postgres:// (Heroku-style) and bare postgresql:// both mean psycopg 3
+    url = os.getenv("DATABASE_URL", "sqlite:///trendfuel.db")
+    for scheme in ("postgres://", "postgresql://"):
+        if url.startswith(scheme):
+            return "postgresql+psycopg://" + url[len(scheme):]
+    return url
+
+def engine_options(url: str) -> dict:
+    if not url.startswith("postgresql"):
+        return {}
+    share = max(DB_MAX_CONNECTIONS // max(WEB_CONCURRENCY, 1), 2)
+    pool_size = min(DB_POOL_SIZE or share // 2, share)
+    return {
+        "pool_size": pool_size,
+        "max_overflow": share - pool_size,
+        "pool_timeout": DB_POOL_TIMEOUT_S,
+        "pool_recycle": DB_POOL_RECYCLE_S,
+        "pool_pre_ping": True,
+    }
+
 app = Flask(__name__)
-app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", "sqlite:///trendfuel.db")
+app.config["SQLALCHEMY_DATABASE_URI"] = database_url()
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 app.config["MAX_CONTENT_LENGTH"] = 12 * 1024 * 1024
-db = SQLAlchemy(app)
+app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
+app.config["SESSION_COOKIE_HTTPONLY"] = True
+app.config["PERMANENT_SESSION_LIFETIME"] = timedelta(days=365)
+
+read_engine = None    # mode=ro SQLite pool, created when SINGLE_WRITER is on
+write_engine = None   # the writer thread's own connection, same condition
+
+class RoutingSession(FlaskSession):
+    # Migrations run on the connection holding the migration lock; the writer
+    # thread's session uses write_engine; sessions marked read_only (see
+    # read_only()) query through read_engine.
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get("migrate_conn") is not None:
+            return self.info["migrate_conn"]
+        if bind is None and write_engine is not None and self.info.get("writer"):
+            return write_engine
+        if bind is None and read_engine is not None and self.info.get("read_only") and not self._flushing:
+            return read_engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={"class_": RoutingSession})
+
+def load_secret_key() -> str:
+    # SECRET_KEY must be shared by all workers; without it, one is generated
+    # once into the instance folder (O_EXCL, so racing workers agree).
+    key = os.getenv("SECRET_KEY", "").strip()
+    if key:
+        return key
+    path = os.path.join(app.instance_path, "secret_key")
+    os.makedirs(app.instance_path, exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w") as f:
+            f.write(uuid.uuid4().hex + uuid.uuid4().hex)
+    except FileExistsError:
+        pass
+    for _ in range(50):
+        with open(path) as f:
+            key = f.read().strip()
+        if key:
+            return key
+        time.sleep(0.01)
+    raise RuntimeError("instance/secret_key is empty")
+
+app.secret_key = load_secret_key()
 
 UPLOAD_DIR = os.path.join(app.root_path, "static", "uploads")
 THUMB_DIR = os.path.join(app.root_path, "static", "thumbs")
@@ -306,6 +530,53 @@ def now_utc() -> datetime:
 def utc_day_str(dt: datetime | None = None) -> str:
     return (dt or now_utc()).date().isoformat()
 
+def calc_hot_rank(likes: int, dislikes: int, created_at: datetime | None) -> float:
+    # log2(base * 0.5 ** (age / half_life)) + const, with the "now" term dropped:
+    # ordering matches the half-life decay but the value never needs rescoring.
+    # A net-negative score decays up towards 0, so its log is taken with the sign
+    # flipped (older sorts higher) and squashed below HOT_RANK_FLOOR; every
+    # positive tip still outranks every net-zero one, and those every negative one.
+    votes = ((likes or 0) * HOT_LIKE_WEIGHT) - ((dislikes or 0) * HOT_DISLIKE_WEIGHT)
+    base = HOT_BASE + votes
+    age = epoch_hours(created_at) / HOT_HALF_LIFE_HOURS
+    if base > 0:
+        return math.log2(base) + age
+    if base == 0:
+        return HOT_RANK_FLOOR
+    return HOT_RANK_FLOOR - logaddexp2(0.0, math.log2(-base) + age)
+
+def epoch_hours(at: datetime | None) -> float:
+    created = at or HOT_EPOCH
+    if created.tzinfo is not None:
+        created = created.astimezone(timezone.utc).replace(tzinfo=None)
+    return (created - HOT_EPOCH).total_seconds() / 3600.0
+
+def logaddexp2(a: float | None, b: float) -> float:
+    # log2(2**a + 2**b) without overflow
+    if a is None:
+        return b
+    hi, lo = (a, b) if a > b else (b, a)
+    return hi + math.log2(1.0 + 2.0 ** (lo - hi))
+
+def calc_hot_rank_stored(likes: int, dislikes: int, created_at: str | None) -> float:
+    # SQLite's calc_hot_rank(): created_at arrives as the stored text.
+    return calc_hot_rank(likes, dislikes, datetime.fromisoformat(created_at) if created_at else None)
+
+def hot_rank_sql(likes, dislikes, created_at):
+    # calc_hot_rank() as a SQL expression, so an UPDATE can set it from the
+    # counts it is writing.
+    if db.engine.dialect.name == "sqlite":
+        return db.func.calc_hot_rank(likes, dislikes, created_at)   # registered on each connection, see sqlite_connect()
+    log2 = lambda x: db.func.ln(x) / math.log(2.0)  # noqa: E731
+    base = HOT_BASE + likes * HOT_LIKE_WEIGHT - dislikes * HOT_DISLIKE_WEIGHT
+    since = db.func.coalesce(created_at, HOT_EPOCH) - db.literal(HOT_EPOCH, db.DateTime)
+    age = db.cast(db.extract("epoch", since), db.Float) / 3600.0 / HOT_HALF_LIFE_HOURS
+    return db.case(
+        (base > 0, log2(base) + age),
+        (base == 0, HOT_RANK_FLOOR),
+        else_=HOT_RANK_FLOOR - logaddexp2_sql(0.0, log2(-base) + age),
+    )
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     handle = db.Column(db.String(48), unique=True, nullable=False)
@@ -315,6 +586,7 @@ class User(db.Model):
 
     checkin_streak = db.Column(db.Integer, default=0)
     last_checkin_day = db.Column(db.String(10), default="")  # YYYY-MM-DD
+    session_version = db.Column(db.Integer, default=1)       # bump to revoke all sessions
 
 class Tip(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -325,49 +597,591 @@ class Tip(db.Model):
     thumb_path = db.Column(db.String(260), default="")
     tags = db.Column(db.String(200), default="")
     note = db.Column(db.Text, default="")
-    created_at = db.Column(db.DateTime, default=now_utc)
+    created_at = db.Column(db.DateTime, default=now_utc, index=True)
 
     author_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     author = db.relationship("User", backref="tips")
 
     likes_count = db.Column(db.Integer, default=0)
     dislikes_count = db.Column(db.Integer, default=0)
-
-class Like(db.Model):
+    hot_rank = db.Column(db.Float, default=0.0, index=True)
+    thumb_state = db.Column(db.String(8), default="")   # "", pending, ready, failed, skipped
+    thumb_meta = db.Column(db.Text, default="")         # JSON: variant widths/formats + intrinsic size
+    blob_sha = db.Column(db.String(64), index=True)      # uploads only; NULL for pre-dedup uploads
+    phash = db.Column(db.String(16))                     # dHash hex, set by the thumbnail job
+    phash_b0 = db.Column(db.Integer, index=True)
+    phash_b1 = db.Column(db.Integer, index=True)
+    phash_b2 = db.Column(db.Integer, index=True)
+    phash_b3 = db.Column(db.Integer, index=True)
+    near_dup_of = db.Column(db.Integer)                  # earliest older tip with a near-identical image
+    link_canon = db.Column(db.Text, unique=True, index=True)   # canonical_url(link_url); NULL if none
+    # AUTOINCREMENT: otherwise SQLite hands out max(id) + 1, which after the
+    # newest tip is deleted can be an id already in archived_tip
+    __table_args__ = (db.Index("ix_tip_author_created", "author_id", "created_at"), {"sqlite_autoincrement": True})
+
+class Tag(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    tip_id = db.Column(db.Integer, db.ForeignKey("tip.id"), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    name = db.Column(db.String(TAG_MAX_LEN), unique=True, nullable=False)   # normalize_tag()
+    use_count = db.Column(db.Integer, nullable=False, default=0)
     created_at = db.Column(db.DateTime, default=now_utc)
-    __table_args__ = (db.UniqueConstraint("tip_id", "user_id", name="uq_like_tip_user"),)
 
-class Dislike(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    tip_id = db.Column(db.Integer, db.ForeignKey("tip.id"), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+class TagTrend(db.Model):
+    # score = log2(sum of w * 2 ** (hours since HOT_EPOCH / half-life)) over
+    # every event. Like hot_rank, ordering by score equals ordering by the
+    # decayed count, so rows never need rescoring; the decayed count itself is
+    # 2 ** (score - trend_age(now)).
+    name = db.Column(db.String(TAG_MAX_LEN), primary_key=True)
+    score = db.Column(db.Float, nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, default=now_utc)
+
+class TipTag(db.Model):
+    # Tip <-> Tag. The tip's sort keys are copied in so a tag page is a single
+    # range scan of (tag_id, key) instead of a join + sort.
+    tip_id = db.Column(db.Integer, db.ForeignKey("tip.id"), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey("tag.id"), primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    hot_rank = db.Column(db.Float, nullable=False, default=0.0)
+    __table_args__ = (
+        db.Index("ix_tip_tag_new", "tag_id", "created_at", "tip_id"),
+        db.Index("ix_tip_tag_hot", "tag_id", "hot_rank", "tip_id"),
+    )
+
+class TitleBand(db.Model):
+    # MinHash LSH buckets of a tip's title, one row per band with the band's
+    # rows hashed into one 64-bit key (see title_band_keys). Titles that share
+    # a key are candidates for "already posted".
+    tip_id = db.Column(db.Integer, db.ForeignKey("tip.id"), primary_key=True)
+    band = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.BigInteger, nullable=False)
+    __table_args__ = (db.Index("ix_title_band_key", "key", "tip_id"),)
+
+class Blob(db.Model):
+    # One row per distinct uploaded file (sha256 of its bytes), shared by every
+    # tip that uploaded the same content. thumb_* is mirrored onto those tips so
+    # the feed never has to join.
+    sha = db.Column(db.String(64), primary_key=True)
+    upload_path = db.Column(db.String(260), nullable=False)
+    thumb_path = db.Column(db.String(260), default="")
+    thumb_state = db.Column(db.String(8), default="")
+    thumb_meta = db.Column(db.Text, default="")
+    phash = db.Column(db.String(16))
+    refcount = db.Column(db.Integer, nullable=False, default=0)
     created_at = db.Column(db.DateTime, default=now_utc)
-    __table_args__ = (db.UniqueConstraint("tip_id", "user_id", name="uq_dislike_tip_user"),)
 
+class Vote(db.Model):
+    # One row per (tip, user). value: 1 = like, -1 = dislike, 0 = withdrawn.
+    # Rows are kept at 0 so the reward-once flags survive toggling.
+    tip_id = db.Column(db.Integer, db.ForeignKey("tip.id"), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    value = db.Column(db.SmallInteger, nullable=False, default=0)
+    rewarded_like = db.Column(db.Boolean, nullable=False, default=False)
+    rewarded_dislike = db.Column(db.Boolean, nullable=False, default=False)
+    prev_value = db.Column(db.SmallInteger, nullable=False, server_default="0")         # before the last cast_vote()
+    rewarded_now = db.Column(db.Boolean, nullable=False, server_default=db.false())   # the last cast_vote() earned points
+    created_at = db.Column(db.DateTime, default=now_utc)
+    updated_at = db.Column(db.DateTime, default=now_utc)
+    __table_args__ = (db.Index("ix_vote_user_tip", "user_id", "tip_id"),)
 
-class VoteReward(db.Model):
+class ThumbJob(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    tip_id = db.Column(db.Integer, db.ForeignKey("tip.id"), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    kind = db.Column(db.String(8), nullable=False)  # "like" or "dislike"
+    tip_id = db.Column(db.Integer, nullable=False, index=True)
+    blob_sha = db.Column(db.String(64), index=True)        # set: result goes to every tip of the blob
+    src_path = db.Column(db.String(260), nullable=False)   # relative to static/
+    state = db.Column(db.String(8), nullable=False, default="queued")  # queued, running, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(255), default="")
+    run_after = db.Column(db.DateTime, default=now_utc)
+    claimed_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=now_utc)
-    __table_args__ = (db.UniqueConstraint("tip_id", "user_id", "kind", name="uq_reward_tip_user_kind"),)
+    __table_args__ = (db.Index("ix_thumb_job_state_run_after", "state", "run_after"),)
+
+class StreamEvent(db.Model):
+    # Short-lived log that carries live events to SSE clients in every worker.
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(8), nullable=False)   # "vote" or "tip"
+    tip_id = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=now_utc, index=True)
+
+class ArchivedTip(db.Model):
+    # A tip moved out of the hot tables by archive_cold_tips(), same id. Its
+    # vote rows are dropped; the counts are final. Read only via /tip/<id>.
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(140), nullable=False)
+    link_url = db.Column(db.String(500), default="")
+    image_url = db.Column(db.String(500), default="")
+    upload_path = db.Column(db.String(260), default="")
+    thumb_path = db.Column(db.String(260), default="")
+    thumb_state = db.Column(db.String(8), default="")
+    thumb_meta = db.Column(db.Text, default="")
+    tags = db.Column(db.String(200), default="")
+    note = db.Column(db.Text, default="")
+    author_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    author = db.relationship("User")
+    created_at = db.Column(db.DateTime, nullable=False)
+    likes_count = db.Column(db.Integer, default=0)
+    dislikes_count = db.Column(db.Integer, default=0)
+    blob_sha = db.Column(db.String(64))                  # keeps its blob reference
+    near_dup_of = db.Column(db.Integer)
+    link_canon = db.Column(db.Text, index=True)
+    archived_at = db.Column(db.DateTime, nullable=False)
+
+class SchemaVersion(db.Model):
+    # One row per applied migration (see MIGRATIONS).
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), nullable=False)
+    applied_at = db.Column(db.DateTime, default=now_utc)
 
-def ensure_schema():
-    db.create_all()
+# -----------------------------
+# Schema migrations
+# -----------------------------
+# Each migration runs once, in order, and is recorded in schema_version. A
+# worker that finds pending migrations takes a database-wide lock (BEGIN
+# IMMEDIATE on SQLite, a transaction-scoped advisory lock on Postgres) and
+# runs them on that one connection; the others wait, then find nothing left.
+# While it runs, db.session is routed to the locked connection, so helpers'
+# own commits fold into the migration transaction.
+MIGRATION_LOCK_KEY = 0x70696E70       # pg_advisory_xact_lock key ("pinp")
+MIGRATION_LOCK_WAIT_S = 600.0
+
+def add_missing_columns(table: str, columns: dict) -> set:
+    have = {c["name"] for c in db.inspect(db.session.connection()).get_columns(table)}
+    added = set()
+    for name, ddl in columns.items():
+        if name not in have:
+            db.session.execute(db.text(f'ALTER TABLE "{table}" ADD COLUMN {name} {ddl}'))
+            added.add(name)
+    return added
+
+def migrate_baseline() -> None:
+    # Everything databases created before versioning may be missing;
+    # a no-op on a fresh database.
+    add_missing_columns("user", {
+        "password_hash": "VARCHAR(255) DEFAULT ''",
+        "session_version": "INTEGER DEFAULT 1",
+    })
+    added = add_missing_columns("tip", {
+        "thumb_state": "VARCHAR(8) DEFAULT ''",
+        "thumb_meta": "TEXT DEFAULT ''",
+        "hot_rank": "FLOAT DEFAULT 0",
+        "blob_sha": "VARCHAR(64)",
+        "link_canon": "TEXT",
+        "phash": "VARCHAR(16)",
+        "near_dup_of": "INTEGER",
+        **{f"phash_b{i}": "INTEGER" for i in range(4)},
+    })
+    add_missing_columns("blob", {"phash": "VARCHAR(16)"})
+    add_missing_columns("thumb_job", {"blob_sha": "VARCHAR(64)"})
+    for col in ("created_at", "hot_rank", "blob_sha", "phash_b0", "phash_b1", "phash_b2", "phash_b3"):
+        db.session.execute(db.text(f"CREATE INDEX IF NOT EXISTS ix_tip_{col} ON tip ({col})"))
+    if "link_canon" in added:
+        backfill_link_canon()
+    db.session.execute(db.text("CREATE UNIQUE INDEX IF NOT EXISTS ix_tip_link_canon ON tip (link_canon)"))
+    if "hot_rank" in added:
+        backfill_hot_rank()
+    migrate_legacy_votes()
+    if not db.session.query(TipTag.tip_id).first() and db.session.query(Tip.id).filter(Tip.tags != "").first():
+        backfill_tip_tags()
+
+def migrate_hot_path_indexes() -> None:
+    # Lookups that were still full scans; see `flask --app app check-query-plans`.
+    for ddl in (
+        "CREATE INDEX IF NOT EXISTS ix_tip_author_created ON tip (author_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS ix_vote_user_tip ON vote (user_id, tip_id)",
+        "CREATE INDEX IF NOT EXISTS ix_thumb_job_blob_sha ON thumb_job (blob_sha)",
+        "CREATE INDEX IF NOT EXISTS ix_stream_event_created_at ON stream_event (created_at)",
+    ):
+        db.session.execute(db.text(ddl))
+
+def migrate_archive_table() -> None:
+    ArchivedTip.__table__.create(db.session.connection(), checkfirst=True)
+
+def migrate_title_bands() -> None:
+    TitleBand.__table__.create(db.session.connection(), checkfirst=True)
+    backfill_title_bands(TITLE_BACKFILL_MAX)
+
+def migrate_search_index() -> None:
+    # External-content FTS5 table over tip(title, note, tags), kept in sync by
+    # triggers. Vote/rank updates don't touch these columns, so they don't fire.
+    if db.engine.dialect.name != "sqlite":
+        return
+    if not db.session.execute(db.text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar():
+        app.logger.warning("SQLite was built without FTS5; search stays on LIKE scans")
+        return
+    exists = db.session.execute(db.text("SELECT 1 FROM sqlite_master WHERE name = 'tip_fts'")).first()
+    db.session.execute(db.text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS tip_fts USING fts5(title, note, tags, "
+        f"content='tip', content_rowid='id', tokenize='{FTS_TOKENIZE}')"
+    ))
+    db.session.execute(db.text(
+        "CREATE TRIGGER IF NOT EXISTS tip_fts_ai AFTER INSERT ON tip BEGIN "
+        "INSERT INTO tip_fts(rowid, title, note, tags) VALUES (new.id, new.title, new.note, new.tags); END"
+    ))
+    db.session.execute(db.text(
+        "CREATE TRIGGER IF NOT EXISTS tip_fts_ad AFTER DELETE ON tip BEGIN "
+        "INSERT INTO tip_fts(tip_fts, rowid, title, note, tags) VALUES ('delete', old.id, old.title, old.note, old.tags); END"
+    ))
+    db.session.execute(db.text(
+        "CREATE TRIGGER IF NOT EXISTS tip_fts_au AFTER UPDATE OF title, note, tags ON tip BEGIN "
+        "INSERT INTO tip_fts(tip_fts, rowid, title, note, tags) VALUES ('delete', old.id, old.title, old.note, old.tags); "
+        "INSERT INTO tip_fts(rowid, title, note, tags) VALUES (new.id, new.title, new.note, new.tags); END"
+    ))
+    if not exists:
+        db.session.execute(db.text("INSERT INTO tip_fts(tip_fts) VALUES ('rebuild')"))
+
+def migrate_tip_autoincrement() -> None:
+    # Rebuilds tip with AUTOINCREMENT (SQLite can't ALTER it in) and starts
+    # its sequence past every archived id. Foreign keys aren't enforced, so
+    # the referencing tables are left as they are.
+    if db.engine.dialect.name != "sqlite":
+        return
+    conn = db.session.connection()
+    ddl = db.session.execute(db.text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'tip'")).scalar()
+    if "AUTOINCREMENT" not in ddl.upper():
+        scratch = db.MetaData()
+        User.__table__.to_metadata(scratch)
+        rebuilt = Tip.__table__.to_metadata(scratch, name="tip_new")
+        have = {c["name"] for c in db.inspect(conn).get_columns("tip")}
+        cols = ", ".join(f'"{c.name}"' for c in Tip.__table__.columns if c.name in have)
+        db.session.execute(CreateTable(rebuilt))
+        db.session.execute(db.text(f"INSERT INTO tip_new ({cols}) SELECT {cols} FROM tip"))
+        db.session.execute(db.text("DROP TABLE tip"))   # its indexes and triggers go with it
+        db.session.execute(db.text("ALTER TABLE tip_new RENAME TO tip"))
+        for index in Tip.__table__.indexes:
+            index.create(conn, checkfirst=True)
+        migrate_search_index()
+    top = db.session.execute(db.text(
+        "SELECT max(coalesce((SELECT max(id) FROM tip), 0), coalesce((SELECT max(id) FROM archived_tip), 0))"
+    )).scalar()
+    if not db.session.execute(db.text("UPDATE sqlite_sequence SET seq = max(seq, :top) WHERE name = 'tip'"),
+                              {"top": top}).rowcount:
+        db.session.execute(db.text("INSERT INTO sqlite_sequence (name, seq) VALUES ('tip', :top)"), {"top": top})
+
+def migrate_tip_triggers() -> None:
+    # A vote is then two or three statements (see apply_vote): the tip's
+    # counter UPDATE also copies hot_rank into tip_tag and logs the "vote"
+    # stream event, in the same transaction.
+    add_missing_columns("vote", {
+        "prev_value": "SMALLINT NOT NULL DEFAULT 0",
+        "rewarded_now": "BOOLEAN NOT NULL DEFAULT FALSE",
+    })
+    if db.engine.dialect.name == "sqlite":
+        db.session.execute(db.text(
+            "CREATE TRIGGER IF NOT EXISTS tip_hot_rank_au AFTER UPDATE OF hot_rank ON tip "
+            "WHEN new.hot_rank IS NOT old.hot_rank BEGIN "
+            "UPDATE tip_tag SET hot_rank = new.hot_rank WHERE tip_id = new.id; END"
+        ))
+        db.session.execute(db.text(
+            "CREATE TRIGGER IF NOT EXISTS tip_vote_event_au AFTER UPDATE OF likes_count, dislikes_count ON tip "
+            "WHEN new.likes_count IS NOT old.likes_count OR new.dislikes_count IS NOT old.dislikes_count BEGIN "
+            "INSERT INTO stream_event (kind, tip_id, data, created_at) VALUES ('vote', new.id, "
+            "json_object('id', new.id, 'l', max(new.likes_count, 0), 'd', max(new.dislikes_count, 0)), "
+            "strftime('%Y-%m-%d %H:%M:%f', 'now')); END"
+        ))
+        return
+    if db.engine.dialect.name != "postgresql":
+        return
+    db.session.execute(db.text(
+        "CREATE OR REPLACE FUNCTION tip_hot_rank_au() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+        "UPDATE tip_tag SET hot_rank = NEW.hot_rank WHERE tip_id = NEW.id; RETURN NULL; END $$"
+    ))
+    db.session.execute(db.text(
+        "CREATE OR REPLACE FUNCTION tip_vote_event_au() RETURNS trigger LANGUAGE plpgsql AS $$ BEGIN "
+        "INSERT INTO stream_event (kind, tip_id, data, created_at) VALUES ('vote', NEW.id, "
+        "json_build_object('id', NEW.id, 'l', greatest(NEW.likes_count, 0), 'd', greatest(NEW.dislikes_count, 0))::text, "
+        "now() AT TIME ZONE 'utc'); RETURN NULL; END $$"
+    ))
+    db.session.execute(db.text(
+        "CREATE OR REPLACE TRIGGER tip_hot_rank_au AFTER UPDATE OF hot_rank ON tip FOR EACH ROW "
+        "WHEN (NEW.hot_rank IS DISTINCT FROM OLD.hot_rank) EXECUTE FUNCTION tip_hot_rank_au()"
+    ))
+    db.session.execute(db.text(
+        "CREATE OR REPLACE TRIGGER tip_vote_event_au AFTER UPDATE OF likes_count, dislikes_count ON tip FOR EACH ROW "
+        "WHEN (NEW.likes_count IS DISTINCT FROM OLD.likes_count OR NEW.dislikes_count IS DISTINCT FROM OLD.dislikes_count) "
+        "EXECUTE FUNCTION tip_vote_event_au()"
+    ))
+
+def schema_version() -> int:
+    if not db.inspect(db.engine).has_table("schema_version"):
+        return 0
+    return db.session.execute(db.select(db.func.max(SchemaVersion.version))).scalar() or 0
+
+def lock_for_migration(conn) -> bool:
+    # True once this connection holds the migration lock.
+    if conn.dialect.name == "postgresql":
+        conn.execute(db.text("SELECT pg_advisory_xact_lock(:k)"), {"k": MIGRATION_LOCK_KEY})
+        return True
+    if conn.dialect.name != "sqlite":
+        conn.begin()
+        return True
     try:
-        cols = [r[1] for r in db.session.execute(db.text('PRAGMA table_info("user")')).fetchall()]
-        if "password_hash" not in cols:
-            db.session.execute(db.text('ALTER TABLE "user" ADD COLUMN password_hash VARCHAR(255) DEFAULT ""'))
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        return True
+    except OperationalError as e:
+        conn.rollback()
+        if "locked" not in str(e).lower():
+            raise
+        return False
+
+def run_migrations() -> int:
+    # Returns the number of migrations applied by this call.
+    latest = MIGRATIONS[-1][0]
+    if schema_version() >= latest:
+        return 0
+    db.session.close()
+    deadline = time.monotonic() + MIGRATION_LOCK_WAIT_S
+    with db.engine.connect() as conn:
+        while not lock_for_migration(conn):
+            if time.monotonic() > deadline:
+                raise RuntimeError("timed out waiting for another worker's schema migration")
+            time.sleep(0.5)
+        db.session.info["migrate_conn"] = conn
+        applied = 0
+        try:
+            db.metadata.create_all(conn)
+            done = db.session.execute(db.select(db.func.max(SchemaVersion.version))).scalar() or 0
+            for version, name, migrate in MIGRATIONS:
+                if version <= done:
+                    continue
+                app.logger.info("applying schema migration %d (%s)", version, name)
+                migrate()
+                db.session.add(SchemaVersion(version=version, name=name))
+                db.session.flush()
+                applied += 1
             db.session.commit()
-    except Exception:
-        db.session.rollback()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            db.session.info.pop("migrate_conn", None)
+            db.session.close()
+    return applied
+
+def backfill_link_canon() -> None:
+    # Oldest tip keeps each canonical link; later copies stay NULL so the
+    # unique index can be built over existing data.
+    seen = set()
+    updates = []
+    rows = db.session.execute(db.text("SELECT id, link_url FROM tip WHERE link_url != '' ORDER BY id")).all()
+    for tip_id, link in rows:
+        canon = canonical_url(link)
+        if canon and canon not in seen:
+            seen.add(canon)
+            updates.append({"i": tip_id, "c": canon})
+    if updates:
+        db.session.execute(db.text("UPDATE tip SET link_canon = :c WHERE id = :i"), updates)
+
+def migrate_legacy_votes() -> None:
+    # like / dislike / vote_reward -> vote, then drop the old tables.
+    tables = set(db.inspect(db.session.connection()).get_table_names())
+    legacy = {"like", "dislike", "vote_reward"} & tables
+    if not legacy:
+        return
+    parts = []
+    if "like" in legacy:
+        parts.append('SELECT tip_id, user_id, 1 AS il, 0 AS idl, 0 AS rl, 0 AS rd, created_at FROM "like"')
+    if "dislike" in legacy:
+        parts.append("SELECT tip_id, user_id, 0, 1, 0, 0, created_at FROM dislike")
+    if "vote_reward" in legacy:
+        parts.append(
+            "SELECT tip_id, user_id, 0, 0, "
+            "CASE WHEN kind = 'like' THEN 1 ELSE 0 END, "
+            "CASE WHEN kind = 'dislike' THEN 1 ELSE 0 END, created_at FROM vote_reward"
+        )
+    db.session.execute(db.text(
+        "INSERT INTO vote (tip_id, user_id, value, rewarded_like, rewarded_dislike, created_at, updated_at) "
+        "SELECT tip_id, user_id, "
+        "CASE WHEN SUM(il) > 0 THEN 1 WHEN SUM(idl) > 0 THEN -1 ELSE 0 END, "
+        "MAX(rl) > 0, MAX(rd) > 0, MIN(created_at), MAX(created_at) "
+        f"FROM ({' UNION ALL '.join(parts)}) AS legacy GROUP BY tip_id, user_id"
+    ))
+    for t in legacy:
+        db.session.execute(db.text(f'DROP TABLE "{t}"'))
+    db.session.commit()
 
-with app.app_context():
-    ensure_schema()
+def backfill_hot_rank(batch: int = 500) -> int:
+    last_id = 0
+    done = 0
+    while True:
+        rows = (db.session.query(Tip.id, Tip.likes_count, Tip.dislikes_count, Tip.created_at)
+                .filter(Tip.id > last_id).order_by(Tip.id).limit(batch).all())
+        if not rows:
+            break
+        db.session.execute(db.update(Tip), [
+            {"id": r.id, "hot_rank": calc_hot_rank(r.likes_count, r.dislikes_count, r.created_at)}
+            for r in rows
+        ])
+        db.session.execute(
+            db.update(TipTag).where(TipTag.tip_id.in_([r.id for r in rows]))
+            .values(hot_rank=db.select(Tip.hot_rank).where(Tip.id == TipTag.tip_id).scalar_subquery())
+        )
+        db.session.commit()
+        last_id = rows[-1].id
+        done += len(rows)
+    return done
+
+@app.cli.command("backfill-hot-rank")
+def backfill_hot_rank_cmd():
+    """Recompute Tip.hot_rank for every existing row."""
+    n = backfill_hot_rank()
+    print(f"hot_rank updated for {n} tips")
+
+def backfill_tip_tags(batch: int = 500) -> int:
+    # Re-parses Tip.tags into tag/tip_tag. Safe to re-run: each batch replaces
+    # its tips' rows and use_count is recounted at the end.
+    last_id = 0
+    done = 0
+    while True:
+        rows = (db.session.query(Tip.id, Tip.tags, Tip.created_at, Tip.hot_rank)
+                .filter(Tip.id > last_id).order_by(Tip.id).limit(batch).all())
+        if not rows:
+            break
+        db.session.execute(db.delete(TipTag).where(TipTag.tip_id.in_([r.id for r in rows])))
+        for r in rows:
+            set_tip_tags(r.id, parse_tags(r.tags), r.created_at, r.hot_rank or 0.0, count=False)
+        db.session.commit()
+        last_id = rows[-1].id
+        done += len(rows)
+    db.session.execute(db.update(Tag).values(
+        use_count=db.select(db.func.count()).where(TipTag.tag_id == Tag.id).scalar_subquery()
+    ))
+    db.session.commit()
+    return done
+
+def backfill_title_bands(limit: Optional[int] = None, batch: int = 500) -> int:
+    # Newest tips first; tips that already have bands are skipped, so it resumes.
+    last_id = None
+    done = 0
+    while limit is None or done < limit:
+        q = db.select(Tip.id, Tip.title).where(~db.exists().where(TitleBand.tip_id == Tip.id))
+        if last_id is not None:
+            q = q.where(Tip.id < last_id)
+        size = batch if limit is None else min(batch, limit - done)
+        rows = db.session.execute(q.order_by(Tip.id.desc()).limit(size)).all()
+        if not rows:
+            break
+        for tip_id, title in rows:
+            set_title_bands(tip_id, title)
+        db.session.commit()
+        last_id = rows[-1].id
+        done += len(rows)
+    return done
+
+@app.cli.command("backfill-title-bands")
+def backfill_title_bands_cmd():
+    """Index the titles of tips the migration left out (older than TITLE_BACKFILL_MAX)."""
+    n = backfill_title_bands()
+    print(f"title bands written for {n} tips")
+
+@app.cli.command("backfill-tags")
+def backfill_tags_cmd():
+    """Parse Tip.tags of every existing row into the tag tables."""
+    n = backfill_tip_tags()
+    print(f"tags parsed for {n} tips")
+
+MIGRATIONS = [
+    (1, "baseline columns and backfills", migrate_baseline),
+    (2, "hot path indexes", migrate_hot_path_indexes),
+    (3, "archived_tip table", migrate_archive_table),
+    (4, "hot_rank below every positive tip for net-negative ones", backfill_hot_rank),
+    (5, "title_band table", migrate_title_bands),
+    (6, "tip_fts full-text index (SQLite)", migrate_search_index),
+    (7, "tip ids never reused (SQLite)", migrate_tip_autoincrement),
+    (8, "vote upsert columns, tip_tag/stream_event triggers", migrate_tip_triggers),
+]
+
+@app.cli.command("migrate")
+def migrate_cmd():
+    """Apply pending schema migrations (workers also do this on start)."""
+    n = run_migrations()
+    print(f"applied {n} migrations; schema version {schema_version()}")
+
+def hot_queries() -> list:
+    # (label, statement) for every lookup on the request/worker hot paths.
+    now, uid, tid = now_utc(), 1, 1
+    feed = lambda src, id_col, key: db.select(id_col, key).order_by(key.desc(), id_col.desc()).limit(FEED_PAGE_SIZE + 1)
+    return [
+        ("feed new", feed(Tip, Tip.id, Tip.created_at)),
+        ("feed new, next page", feed(Tip, Tip.id, Tip.created_at).where(db.tuple_(Tip.created_at, Tip.id) < (now, tid))),
+        ("feed hot", feed(Tip, Tip.id, Tip.hot_rank)),
+        ("feed hot, next page", feed(Tip, Tip.id, Tip.hot_rank).where(db.tuple_(Tip.hot_rank, Tip.id) < (1.0, tid))),
+        ("tag feed new", feed(TipTag, TipTag.tip_id, TipTag.created_at).where(TipTag.tag_id == 1)),
+        ("tag feed hot", feed(TipTag, TipTag.tip_id, TipTag.hot_rank).where(TipTag.tag_id == 1)),
+        ("tips by id", db.select(Tip).where(Tip.id.in_([1, 2, 3]))),
+        ("tips by author", db.select(Tip.id).where(Tip.author_id == uid).order_by(Tip.created_at.desc()).limit(20)),
+        ("viewer votes", db.select(Vote.tip_id, Vote.value).where(Vote.user_id == uid, Vote.tip_id.in_([1, 2, 3]),
+                                                                  Vote.value != 0)),
+        ("vote read", db.select(Tip.author_id, Vote.value).outerjoin(
+            Vote, db.and_(Vote.tip_id == Tip.id, Vote.user_id == uid)).where(Tip.id == tid)),
+        ("vote write", db.update(Vote).where(Vote.tip_id == tid, Vote.user_id == uid).values(value=1)),
+        ("tip counters", db.update(Tip).where(Tip.id == tid).values(likes_count=Tip.likes_count + 1)),
+        ("tag hot_rank copies", db.update(TipTag).where(TipTag.tip_id == tid).values(hot_rank=1.0)),
+        ("tip tags", db.select(Tag.id, Tag.name, db.func.count()).join(TipTag, TipTag.tag_id == Tag.id)
+            .where(TipTag.tip_id.in_([1, 2, 3])).group_by(Tag.id, Tag.name)),
+        ("user by id", db.select(User).where(User.id == uid)),
+        ("user by handle", db.select(User).where(User.handle == "x")),
+        ("tag by name", db.select(Tag.id).where(Tag.name == "x")),
+        ("tags since", db.select(Tag.id, Tag.name).where(Tag.id > 1)),
+        ("trending tags", db.select(TagTrend.name).where(TagTrend.score > 1.0)
+            .order_by(TagTrend.score.desc()).limit(TREND_TOP_K)),
+        ("link already posted", db.select(Tip.id).where(Tip.link_canon == "x")),
+        ("near-duplicate image", near_dup_query().params(p0=[1], p1=[2], p2=[3], p3=[4], before=tid, phash="0" * 16)),
+        ("similar titles", db.select(TitleBand.tip_id).where(TitleBand.key.in_([1, 2, 3]))),
+        ("title bands of a tip", db.delete(TitleBand).where(TitleBand.tip_id.in_([1, 2, 3]))),
+        ("tips of a blob", db.update(Tip).where(Tip.blob_sha == "x").values(thumb_state="ready")),
+        ("thumb jobs ready", db.select(ThumbJob.id).where(ThumbJob.state == "queued", ThumbJob.run_after <= now)
+            .order_by(ThumbJob.id).limit(THUMB_WORKERS)),
+        ("thumb queue depth", db.select(db.func.count()).select_from(ThumbJob)
+            .where(ThumbJob.state.in_(["queued", "running"]))),
+        ("thumb jobs of a blob", db.delete(ThumbJob).where(ThumbJob.blob_sha == "x")),
+        ("stream tail", db.select(StreamEvent.id).where(StreamEvent.id > 1).order_by(StreamEvent.id).limit(500)),
+        ("stream prune", db.delete(StreamEvent).where(StreamEvent.created_at < now)),
+        ("cold tips", cold_tip_ids(now, ARCHIVE_CHUNK)),
+        ("archived link", db.select(ArchivedTip.id).where(ArchivedTip.link_canon == "x")),
+    ]
+
+def explain(conn, stmt) -> list[str]:
+    # Runs stmt with EXPLAIN prefixed, so binds are processed as in the app.
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+
+    def add_prefix(_conn, _cursor, statement, parameters, _context, _executemany):
+        return prefix + statement, parameters
+
+    event.listen(conn, "before_cursor_execute", add_prefix, retval=True)
+    try:
+        rows = conn.execute(stmt).all()
+    finally:
+        event.remove(conn, "before_cursor_execute", add_prefix)
+    return [str(r[-1]) for r in rows]
+
+def is_full_scan(line: str) -> bool:
+    if line.lstrip("-> ").startswith("Seq Scan"):
+        return True
+    return line.startswith("SCAN ") and " USING " not in line and "CONSTANT ROW" not in line
+
+@app.cli.command("archive-tips")
+def archive_tips_cmd():
+    """Move tips older than ARCHIVE_AFTER_HOURS into archived_tip."""
+    n = archive_cold_tips()
+    print(f"archived {n} tips")
+
+@app.cli.command("check-query-plans")
+def check_query_plans_cmd():
+    """EXPLAIN every hot-path query; exit 1 if any still scans a whole table."""
+    scans = 0
+    with db.engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            # small tables are cheaper to scan; ask whether an index *can* serve each query
+            conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        for label, stmt in hot_queries():
+            plan = explain(conn, stmt)
+            bad = [line for line in plan if is_full_scan(line.strip())]
+            scans += bool(bad)
+            print(f"{'SCAN' if bad else 'ok  '}  {label}: {' | '.join(line.strip() for line in plan)}")
+        conn.rollback()
+    if scans:
+        raise SystemExit(f"{scans} queries scan a whole table")
 
 # -----------------------------
 # Helpers
@@ -381,11 +1195,87 @@ def get_lang() -> str:
         return c
     return "en"
 
-def get_user() -> Optional[User]:
-    handle = (request.cookies.get("handle") or "").strip()
-    if not handle:
+class UserSnapshot(NamedTuple):
+    id: int
+    handle: str
+    points: int
+    checkin_streak: int
+    last_checkin_day: str
+    session_version: int
+
+class UserCache:
+    # Small per-worker LRU of user snapshots keyed by id. Entries are dropped
+    # after a commit that changed the user's points/streak (see mark_user_changed)
+    # and expire after `ttl` so changes made by other workers show up.
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items = OrderedDict()   # id -> (snapshot, expires_at)
+
+    def get(self, user_id: int) -> Optional[UserSnapshot]:
+        with self._lock:
+            item = self._items.get(user_id)
+            if not item:
+                return None
+            if item[1] < time.monotonic():
+                del self._items[user_id]
+                return None
+            self._items.move_to_end(user_id)
+            return item[0]
+
+    def put(self, snap: UserSnapshot) -> None:
+        with self._lock:
+            self._items[snap.id] = (snap, time.monotonic() + self.ttl)
+            self._items.move_to_end(snap.id)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def invalidate(self, *user_ids: int) -> None:
+        with self._lock:
+            for uid in user_ids:
+                self._items.pop(uid, None)
+
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+def mark_user_changed(*user_ids: int) -> None:
+    db.session.info.setdefault("changed_users", set()).update(user_ids)
+
+@event.listens_for(Session, "after_commit")
+def _drop_changed_users(sess):
+    changed = sess.info.pop("changed_users", None)
+    if changed:
+        user_cache.invalidate(*changed)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(sess):
+    sess.info.pop("changed_users", None)
+
+def load_user_snapshot(user_id: int) -> Optional[UserSnapshot]:
+    snap = user_cache.get(user_id)
+    if snap:
+        return snap
+    row = db.session.execute(
+        db.select(User.id, User.handle, User.points, User.checkin_streak,
+                  User.last_checkin_day, User.session_version)
+        .where(User.id == user_id)
+    ).first()
+    if not row:
+        return None
+    snap = UserSnapshot(row.id, row.handle, row.points or 0, row.checkin_streak or 0,
+                        row.last_checkin_day or "", row.session_version or 1)
+    user_cache.put(snap)
+    return snap
+
+def get_user() -> Optional[UserSnapshot]:
+    # Signed session carries (uid, ver); a cache hit costs no query.
+    uid = session.get("uid")
+    if not isinstance(uid, int):
+        return None
+    snap = load_user_snapshot(uid)
+    if not snap or snap.session_version != session.get("ver"):
         return None
-    return User.query.filter_by(handle=handle).first()
+    return snap
 
 def get_or_create_user(handle: str) -> User:
     handle = handle.strip()
@@ -397,35 +1287,1579 @@ def get_or_create_user(handle: str) -> User:
     db.session.commit()
     return u
 
-def safe_filename(original: str) -> str:
+def native_insert(model):
+    # INSERT that supports ON CONFLICT (SQLite, Postgres); None elsewhere.
+    dialect = {"sqlite": sqlite, "postgresql": postgresql}.get(db.engine.dialect.name)
+    return dialect.insert(model) if dialect else None
+
+def non_negative(expr):
+    return db.case((expr < 0, 0), else_=expr)
+
+def cast_vote(tip_id: int, user_id: int, want: int):
+    # One upsert, decided against the row as it is when written: a first vote
+    # inserts, a repeat withdraws (value 0), anything else switches to want.
+    # The reward flag for want's side is set once; rewarded_now says whether
+    # this call set it, prev_value what the vote was before. Returns that row,
+    # or None if the tip is missing or is the voter's own.
+    now = now_utc()
+    flag = Vote.rewarded_like if want > 0 else Vote.rewarded_dislike
+    flips = Vote.value != want
+    changes = {
+        "value": db.case((flips, want), else_=0),
+        "prev_value": Vote.value,
+        flag.key: db.or_(flag, flips),
+        "rewarded_now": db.and_(flips, db.not_(flag)),
+        "updated_at": now,
+    }
+    first = {
+        "tip_id": Tip.id,
+        "user_id": db.literal(user_id),
+        "value": db.literal(want, db.SmallInteger),
+        "prev_value": db.literal(0, db.SmallInteger),
+        "rewarded_like": db.literal(want > 0),
+        "rewarded_dislike": db.literal(want < 0),
+        "rewarded_now": db.literal(True),
+        "created_at": db.literal(now, db.DateTime),
+        "updated_at": db.literal(now, db.DateTime),
+    }
+    src = db.select(*first.values()).where(Tip.id == tip_id, Tip.author_id != user_id)
+    result = (Vote.value, Vote.prev_value, Vote.rewarded_now)
+    mine = db.and_(Vote.tip_id == tip_id, Vote.user_id == user_id)
+
+    insert = native_insert(Vote)
+    if insert is not None:
+        stmt = insert.from_select(list(first), src).on_conflict_do_update(
+            index_elements=[Vote.tip_id, Vote.user_id], set_=changes)
+        if db.engine.dialect.insert_returning:
+            return db.session.execute(stmt.returning(*result)).first()
+        if not db.session.execute(stmt.execution_options(preserve_rowcount=True)).rowcount:
+            return None
+        return db.session.execute(db.select(*result).where(mine)).first()
+
+    if not db.session.execute(db.update(Vote).where(mine).values(**changes)).rowcount:
+        try:
+            with db.session.begin_nested():
+                if not db.session.execute(db.insert(Vote).from_select(list(first), src)).rowcount:
+                    return None
+        except IntegrityError:
+            db.session.execute(db.update(Vote).where(mine).values(**changes))   # a concurrent first vote won
+    return db.session.execute(db.select(*result).where(mine)).first()
+
+def bump_tip_counts(tip_id: int, d_likes: int, d_dislikes: int):
+    # likes_count = likes_count + :d and the hot_rank that goes with it, in
+    # one UPDATE; triggers copy hot_rank into tip_tag and publish the "vote"
+    # stream event (see migrate_tip_triggers). Returns the tip's
+    # (author_id, likes, dislikes, tags), or None if it is gone.
+    # Not clamped: buffered deltas from different workers can land out of
+    # order, and a -1 clamped away early would be lost for good. Readers clamp.
+    likes = db.func.coalesce(Tip.likes_count, 0) + d_likes
+    dislikes = db.func.coalesce(Tip.dislikes_count, 0) + d_dislikes
+    stmt = (db.update(Tip).where(Tip.id == tip_id)
+            .values(likes_count=likes, dislikes_count=dislikes, hot_rank=hot_rank_sql(likes, dislikes, Tip.created_at)))
+    row = (Tip.author_id, Tip.likes_count, Tip.dislikes_count, Tip.tags)
+    if db.engine.dialect.update_returning:
+        return db.session.execute(stmt.returning(*row)).first()
+    db.session.execute(stmt)
+    return db.session.execute(db.select(*row).where(Tip.id == tip_id)).first()
+
+def add_points(deltas: dict) -> dict:
+    # One UPDATE for every user touched; points never drop below zero.
+    # Returns {user_id: new points} for the rows updated.
+    deltas = {uid: d for uid, d in deltas.items() if d}
+    if not deltas:
+        return {}
+    mark_user_changed(*deltas)
+    stmt = (db.update(User).where(User.id.in_(list(deltas)))
+            .values(points=non_negative(User.points + db.case(deltas, value=User.id, else_=0))))
+    if db.engine.dialect.update_returning:
+        return dict(db.session.execute(stmt.returning(User.id, User.points)).all())
+    db.session.execute(stmt)
+    return dict(db.session.execute(db.select(User.id, User.points).where(User.id.in_(list(deltas)))).all())
+
+def evented() -> bool:
+    # True under gunicorn's gevent worker, which patches threading before loading the app.
+    return bool(gevent_monkey and gevent_monkey.is_module_patched("threading"))
+
+def off_loop(fn, *args):
+    # Calls that block in C (password hashing, sqlite3 waiting out busy_timeout) go
+    # to gevent's native thread pool, so they do not stall every open stream.
+    if evented():
+        return gevent_hub().threadpool.apply(fn, args)
+    return fn(*args)
+
+class IdTail:
+    # "id > last seen" for a table other workers insert into. Postgres hands out
+    # sequence ids before commit, so a lower id can become visible after a higher
+    # one; ids skipped over are re-read for TAIL_GAP_S until they show up (ids of
+    # rolled-back or conflicting inserts never do, and expire).
+    def __init__(self):
+        self.last_id = None
+        self._gaps = OrderedDict()   # id -> monotonic time it was skipped
+
+    def reset(self, last_id: Optional[int]) -> None:
+        self.last_id = last_id
+        self._gaps.clear()
+
+    def condition(self, id_col):
+        if not self._gaps:
+            return id_col > self.last_id
+        return db.or_(id_col > self.last_id, id_col.in_(list(self._gaps)))
+
+    def advance(self, ids: list[int]) -> None:
+        # ids: every id just read, ascending.
+        now = time.monotonic()
+        prev = self.last_id
+        for i in ids:
+            if self._gaps.pop(i, None) is not None or (prev is not None and i <= prev):
+                continue
+            if prev is not None:
+                for missing in range(max(prev + 1, i - TAIL_GAP_MAX), i):
+                    self._gaps[missing] = now
+            prev = i
+        self.last_id = prev
+        while self._gaps and (len(self._gaps) > TAIL_GAP_MAX or next(iter(self._gaps.values())) < now - TAIL_GAP_S):
+            self._gaps.popitem(last=False)
+
+def safe_ext(original: str) -> str:
     ext = os.path.splitext(original)[1].lower()
     if ext not in [".png", ".jpg", ".jpeg", ".webp", ".gif"]:
         ext = ".png"
-    return f"{uuid.uuid4().hex}{ext}"
-
-def make_thumb(src_abs: str, thumb_abs: str, max_side: int = 480) -> None:
-    with Image.open(src_abs) as im:
-        im = im.convert("RGB")
-        w, h = im.size
-        scale = min(max_side / max(w, h), 1.0)
-        nw, nh = int(w * scale), int(h * scale)
-        if (nw, nh) != (w, h):
-            im = im.resize((nw, nh))
-        im.save(thumb_abs, "JPEG", quality=85, optimize=True)
-
-def hot_score(tip: Tip) -> float:
-    age = max((now_utc().replace(tzinfo=None) - tip.created_at).total_seconds(), 0.0)
-
-    age_hours = age / 3600.0
-    decay = 0.5 ** (age_hours / HOT_HALF_LIFE_HOURS)  # half-life decay
-    votes = (tip.likes_count * HOT_LIKE_WEIGHT) - (tip.dislikes_count * HOT_DISLIKE_WEIGHT)
-    base = HOT_BASE + votes
-    return base * decay
+    return ext
+
+# -----------------------------
+# Tags
+# -----------------------------
+TAG_SPLIT = re.compile(r"[,、]|\s+(?=#)")
+
+def normalize_tag(raw: str) -> str:
+    # "#Foo Bar." -> "foo-bar"; width/case folded so variants share one row.
+    t = unicodedata.normalize("NFKC", raw or "").casefold().strip()
+    t = "-".join(t.lstrip("#").strip(" .").split())
+    return "".join(c for c in t if c.isalnum() or c in "-_")[:TAG_MAX_LEN]
+
+def parse_tags(tags: str) -> list[str]:
+    out = []
+    for part in TAG_SPLIT.split(unicodedata.normalize("NFKC", tags or "")):
+        name = normalize_tag(part)
+        if name and name not in out:
+            out.append(name)
+    return out[:TAGS_PER_TIP]
+
+def set_tip_tags(tip_id: int, names: list[str], created_at: datetime, hot_rank: float, count: bool = True) -> None:
+    if not names:
+        return
+    ids = dict(db.session.execute(db.select(Tag.name, Tag.id).where(Tag.name.in_(names))).all())
+    missing = [n for n in names if n not in ids]
+    insert = native_insert(Tag)
+    if missing and insert is not None:
+        db.session.execute(insert.values([{"name": n, "use_count": 0} for n in missing])
+                           .on_conflict_do_nothing(index_elements=[Tag.name]))
+    else:
+        for name in missing:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(db.insert(Tag).values(name=name, use_count=0))
+            except IntegrityError:
+                pass   # created concurrently
+    if missing:
+        ids = dict(db.session.execute(db.select(Tag.name, Tag.id).where(Tag.name.in_(names))).all())
+    db.session.execute(db.insert(TipTag), [
+        {"tip_id": tip_id, "tag_id": ids[n], "created_at": created_at, "hot_rank": hot_rank} for n in names
+    ])
+    if count:
+        db.session.execute(db.update(Tag).where(Tag.id.in_(list(ids.values())))
+                           .values(use_count=Tag.use_count + 1))
+
+def clear_tip_tags(tip_ids: list) -> dict:
+    # Drops the tips' tag rows and takes them off use_count; returns {tag name: rows dropped}.
+    rows = db.session.execute(
+        db.select(Tag.id, Tag.name, db.func.count()).join(TipTag, TipTag.tag_id == Tag.id)
+        .where(TipTag.tip_id.in_(tip_ids)).group_by(Tag.id, Tag.name)
+    ).all()
+    if not rows:
+        return {}
+    db.session.execute(db.delete(TipTag).where(TipTag.tip_id.in_(tip_ids)))
+    dropped = {tag_id: n for tag_id, _, n in rows}
+    db.session.execute(db.update(Tag).where(Tag.id.in_(list(dropped)))
+                       .values(use_count=non_negative(Tag.use_count - db.case(dropped, value=Tag.id, else_=0))))
+    return {name: n for _, name, n in rows}
+
+def tag_id_for(name: str) -> Optional[int]:
+    return db.session.execute(db.select(Tag.id).where(Tag.name == name)).scalar() if name else None
+
+class TagSuggest:
+    # Normalized tag names kept sorted, so every name with a given prefix is
+    # one bisect range; the range's best-used names are memoized per prefix
+    # and only the prefixes of a changed name are dropped. This worker's
+    # submits/deletes bump counts in place; new tags from other workers
+    # arrive by id (see IdTail) every TAG_SUGGEST_SYNC_S and all counts are
+    # reloaded every TAG_SUGGEST_RELOAD_S.
+    def __init__(self):
+        self._names = []
+        self._counts = {}
+        self._tail = IdTail()
+        self._synced = 0.0
+        self._loaded = 0.0
+        self._memo = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _insert(self, name: str, count: int) -> None:
+        if name not in self._counts:
+            bisect.insort(self._names, name)
+        self._counts[name] = count
+        for i in range(1, len(name) + 1):
+            self._memo.pop(name[:i], None)
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if not self._loaded or now - self._loaded > TAG_SUGGEST_RELOAD_S:
+            rows = db.session.execute(db.select(Tag.id, Tag.name, Tag.use_count).order_by(Tag.id)).all()
+            self._counts = {name: count or 0 for _, name, count in rows}
+            self._names = sorted(self._counts)
+            self._tail.advance([r[0] for r in rows])
+            if self._tail.last_id is None:
+                self._tail.reset(0)   # no tags yet
+            self._loaded = self._synced = now
+            self._memo.clear()
+        elif now - self._synced > TAG_SUGGEST_SYNC_S:
+            rows = db.session.execute(
+                db.select(Tag.id, Tag.name, Tag.use_count).where(self._tail.condition(Tag.id)).order_by(Tag.id)
+            ).all()
+            for _, name, count in rows:
+                self._insert(name, count or 0)
+            self._tail.advance([r[0] for r in rows])
+            self._synced = now
+
+    def bump(self, names: list[str], delta: int) -> None:
+        with self._lock:
+            for n in names:
+                self._insert(n, max(self._counts.get(n, 0) + delta, 0))
+
+    def suggest(self, q: str, limit: int = TAG_SUGGEST_LIMIT) -> list[tuple[str, int]]:
+        prefix = normalize_tag(q)
+        if not prefix:
+            return []
+        with self._lock:
+            self._refresh()
+            memo = self._memo.get(prefix)
+            if memo is not None and limit in memo:
+                self._memo.move_to_end(prefix)
+                return memo[limit]
+            names, counts = self._names, self._counts
+            lo = bisect.bisect_left(names, prefix)
+            hi = bisect.bisect_left(names, prefix + "\U0010ffff", lo)
+            # nlargest is stable, so equal counts stay in alphabetical order
+            best = heapq.nlargest(limit, (n for n in names[lo:hi] if counts[n] > 0),
+                                  key=counts.__getitem__)
+            out = [(n, counts[n]) for n in best]
+            self._memo.setdefault(prefix, {})[limit] = out
+            if len(self._memo) > 4096:
+                self._memo.popitem(last=False)
+            return out
+
+tag_suggest = TagSuggest()
+
+# -----------------------------
+# Trending tags
+# -----------------------------
+def trend_age(at: datetime | None = None) -> float:
+    return epoch_hours(at or now_utc()) / TREND_HALF_LIFE_HOURS
+
+def logaddexp2_sql(a, b):
+    if db.engine.dialect.name == "sqlite":
+        return db.func.logaddexp2(a, b)   # registered on each connection, see sqlite_connect()
+    hi, lo = db.func.greatest(a, b), db.func.least(a, b)
+    # Postgres raises on underflow; below 2 ** -1000 the term is lost anyway
+    return hi + db.func.ln(1.0 + db.func.power(2.0, db.func.greatest(lo - hi, -1000.0))) / math.log(2.0)
+
+class TrendingTags:
+    # Events fold into a per-worker dict of pending log-space deltas (O(1) per
+    # tag); a daemon thread merges them into tag_trend every TREND_FLUSH_S with
+    # an atomic score = logaddexp2(score, delta), so workers never overwrite
+    # each other and a restart loses at most one flush interval. Top-K is an
+    # index scan on tag_trend.score, cached briefly.
+    def __init__(self, flush_s: float):
+        self.flush_s = flush_s
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}   # tag name -> log2 delta
+        self._thread = None
+        self._top = (0.0, [])
+        self.flushes = 0
+
+    def record(self, names: list[str], weight: float, at: datetime | None = None) -> None:
+        if not names or weight <= 0:
+            return
+        x = math.log2(weight) + trend_age(at)
+        with self._lock:
+            for n in names:
+                self._pending[n] = logaddexp2(self._pending.get(n), x)
+        self._ensure_thread()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="trending-tags", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_s)
+            try:
+                self.flush()
+            except Exception:
+                app.logger.exception("trending tags flush failed")
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            done = None
+            try:
+                with app.app_context():
+                    done = run_write(lambda sess: self._apply(sess, pending))
+            finally:
+                if done is None:   # failed or stayed busy: the next flush retries these
+                    with self._lock:
+                        for n, x in pending.items():
+                            self._pending[n] = logaddexp2(self._pending.get(n), x)
+            if done is None:
+                return
+            self.flushes += 1
+
+    @staticmethod
+    def _apply(sess, pending: dict) -> bool:
+        now = now_utc()
+        insert = native_insert(TagTrend)
+        if insert is not None:
+            stmt = insert.values([{"name": n, "score": x, "updated_at": now} for n, x in pending.items()])
+            sess.execute(stmt.on_conflict_do_update(
+                index_elements=[TagTrend.name],
+                set_={"score": logaddexp2_sql(TagTrend.score, stmt.excluded.score), "updated_at": now},
+            ))
+            return True
+        for name, x in pending.items():
+            stmt = (db.update(TagTrend).where(TagTrend.name == name)
+                    .values(score=logaddexp2_sql(TagTrend.score, x), updated_at=now))
+            if sess.execute(stmt).rowcount:
+                continue
+            try:
+                with sess.begin_nested():
+                    sess.execute(db.insert(TagTrend).values(name=name, score=x, updated_at=now))
+            except IntegrityError:
+                sess.execute(stmt)   # another worker inserted it first
+        return True
+
+    def top(self, k: int = TREND_TOP_K) -> list[dict]:
+        # [{"name", "heat"}] hottest first; heat is the decayed event count.
+        at, cached = self._top
+        if time.monotonic() - at < TREND_CACHE_S:
+            return cached[:k]
+        now = trend_age()
+        floor = now + math.log2(TREND_MIN)
+        rows = db.session.execute(
+            db.select(TagTrend.name, TagTrend.score).where(TagTrend.score > floor)
+            .order_by(TagTrend.score.desc()).limit(TREND_TOP_K)
+        ).all()
+        cached = [{"name": n, "heat": round(2.0 ** (score - now), 2)} for n, score in rows]
+        self._top = (time.monotonic(), cached)
+        return cached[:k]
+
+trending_tags = TrendingTags(TREND_FLUSH_S)
+atexit.register(trending_tags.flush)
+
+# -----------------------------
+# Upload blobs (content-addressed, ref-counted)
+# -----------------------------
+UPLOAD_CHUNK = 64 * 1024
+
+def store_upload(f) -> tuple[str, str, str]:
+    # Streams the upload to a temp file while hashing it. Returns (sha, temp file,
+    # path relative to static/ to store it under); place_upload() moves it there
+    # once the blob row is held.
+    h = hashlib.sha256()
+    tmp = os.path.join(UPLOAD_DIR, f".tmp-{uuid.uuid4().hex}")
+    try:
+        with open(tmp, "wb") as out:
+            for chunk in iter(lambda: f.stream.read(UPLOAD_CHUNK), b""):
+                h.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        discard_file(tmp)
+        raise
+    sha = h.hexdigest()
+    return sha, tmp, f"uploads/{sha}{safe_ext(f.filename)}"
+
+def place_upload(tmp: str, upload_path: str) -> None:
+    # Inside the transaction that acquired the blob, so a release of the same
+    # content cannot remove the file again before this commits. tmp is linked,
+    # not moved, and stays for a retried transaction; the caller removes it.
+    link = f"{tmp}-{uuid.uuid4().hex[:8]}"
+    os.link(tmp, link)
+    try:
+        os.replace(link, os.path.join(app.root_path, "static", upload_path))
+    except BaseException:
+        discard_file(link)
+        raise
+
+def discard_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def acquire_blob(sha: str, upload_path: str) -> Blob:
+    # refcount + 1, creating the row on first sight.
+    insert = native_insert(Blob)
+    if insert is not None:
+        db.session.execute(insert.values(sha=sha, upload_path=upload_path, refcount=1)
+                           .on_conflict_do_update(index_elements=[Blob.sha], set_={"refcount": Blob.refcount + 1}))
+    while insert is None:
+        if db.session.execute(db.update(Blob).where(Blob.sha == sha)
+                              .values(refcount=Blob.refcount + 1)).rowcount:
+            break
+        try:
+            with db.session.begin_nested():
+                db.session.execute(db.insert(Blob).values(sha=sha, upload_path=upload_path, refcount=1))
+            break
+        except IntegrityError:
+            continue   # a concurrent upload created it; bump that row instead
+    return db.session.execute(db.select(Blob).where(Blob.sha == sha)
+                              .execution_options(populate_existing=True)).scalar_one()
+
+def release_blob(sha: str) -> None:
+    # refcount - 1; at zero the row, any pending job and the files go. The files
+    # are removed before commit, while this transaction still holds the row: an
+    # upload of the same content waits for it, then places its file afresh.
+    stmt = db.update(Blob).where(Blob.sha == sha).values(refcount=Blob.refcount - 1)
+    if db.engine.dialect.update_returning:
+        row = db.session.execute(stmt.returning(Blob.refcount, Blob.upload_path)).first()
+    else:
+        db.session.execute(stmt)
+        row = db.session.execute(db.select(Blob.refcount, Blob.upload_path).where(Blob.sha == sha)).first()
+    if not row or row[0] > 0:
+        return
+    db.session.execute(db.delete(Blob).where(Blob.sha == sha, Blob.refcount <= 0))
+    db.session.execute(db.delete(ThumbJob).where(ThumbJob.blob_sha == sha))
+    remove_blob_files(sha, row[1])
+
+def collect_blob(sess, sha: str, upload_path: str) -> bool:
+    # Files written without a committed reference (a submit that failed after
+    # placing its upload, thumbnails finished after the last release) go unless
+    # the blob is referenced again. A placeholder row at refcount 0 holds the sha
+    # meanwhile, as release_blob's row does; run it through run_write.
+    insert = native_insert(Blob)
+    if insert is not None:
+        sess.execute(insert.values(sha=sha, upload_path=upload_path, refcount=0).on_conflict_do_nothing())
+    else:
+        try:
+            with sess.begin_nested():
+                sess.execute(db.insert(Blob).values(sha=sha, upload_path=upload_path, refcount=0))
+        except IntegrityError:
+            pass
+    path = sess.execute(db.select(Blob.upload_path).where(Blob.sha == sha)).scalar()
+    if path and sess.execute(db.delete(Blob).where(Blob.sha == sha, Blob.refcount <= 0)).rowcount:
+        sess.execute(db.delete(ThumbJob).where(ThumbJob.blob_sha == sha))
+        remove_blob_files(sha, path)
+    return True
+
+def remove_blob_files(sha: str, upload_path: str) -> None:
+    # Only with the blob row held: see release_blob() and collect_blob().
+    paths = [os.path.join(app.root_path, "static", upload_path), os.path.join(THUMB_DIR, f"{sha}.jpg")]
+    paths += glob.glob(os.path.join(THUMB_DIR, f"{sha}-*"))
+    for p in paths:
+        discard_file(p)
+
+# -----------------------------
+# Near-duplicate images
+# -----------------------------
+# Multi-index hashing: if two hashes differ in at most r bits, one of the four
+# 16-bit bands differs in at most r // 4 bits. So probing each band index with
+# its value and every flip of up to r // 4 bits finds all matches without a
+# table scan; the exact distance is then checked in SQL on those candidates,
+# however many there are.
+PHASH_BAND_COLS = (Tip.phash_b0, Tip.phash_b1, Tip.phash_b2, Tip.phash_b3)
+
+def phash_distance(a: Optional[str], b: Optional[str]) -> Optional[int]:
+    # Hamming distance between two hex hashes; also SQLite's phash_distance().
+    if a is None or b is None:
+        return None
+    return (int(a, 16) ^ int(b, 16)).bit_count()
+
+def phash_distance_sql(a, b):
+    if db.engine.dialect.name == "sqlite":
+        return db.func.phash_distance(a, b)   # registered on each connection, see sqlite_connect()
+    def bits(e):
+        return db.cast(db.func.concat("x", db.func.lpad(e, 16, "0")), postgresql.BIT(64))
+    return db.func.bit_count(bits(a).op("#")(bits(b)))   # bit_count(bit): Postgres 14+
+
+def near_dup_query():
+    return (
+        db.select(Tip.id)
+        .where(db.or_(*(col.in_(db.bindparam(f"p{i}", expanding=True)) for i, col in enumerate(PHASH_BAND_COLS))),
+               Tip.id < db.bindparam("before"),
+               phash_distance_sql(Tip.phash, db.bindparam("phash", type_=db.String)) <= PHASH_MAX_DIST)
+        .order_by(Tip.id).limit(1)
+    )
+
+def phash_bands(h: int) -> list[int]:
+    return [(h >> (16 * i)) & 0xFFFF for i in range(4)]
+
+def band_probes(band: int, radius: int) -> list[int]:
+    out = [band]
+    for r in range(1, radius + 1):
+        for bits in itertools.combinations(range(16), r):
+            out.append(band ^ sum(1 << b for b in bits))
+    return out
+
+def find_near_dup(phash: str, before_id: int) -> Optional[int]:
+    # Earliest tip older than before_id whose hash is within PHASH_MAX_DIST.
+    h = int(phash, 16)
+    if not 8 <= h.bit_count() <= 56:
+        return None   # flat or plain-gradient images all hash alike
+    radius = PHASH_MAX_DIST // 4
+    params = {f"p{i}": band_probes(b, radius) for i, b in enumerate(phash_bands(h))}
+    return db.session.execute(near_dup_query(), {**params, "before": before_id, "phash": phash}).scalar()
+
+def set_tip_phash(tip_ids: list[int], phash: str) -> None:
+    # Stores the hash bands, then links each tip to its earliest look-alike.
+    bands = dict(zip(("phash_b0", "phash_b1", "phash_b2", "phash_b3"), phash_bands(int(phash, 16))))
+    db.session.execute(db.update(Tip).where(Tip.id.in_(tip_ids)).values(phash=phash, **bands))
+    for tip_id in tip_ids:
+        dup = find_near_dup(phash, tip_id)
+        if dup:
+            db.session.execute(db.update(Tip).where(Tip.id == tip_id).values(near_dup_of=dup))
+
+# -----------------------------
+# Already-posted hints (links, titles)
+# -----------------------------
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "igshid", "mc_cid", "mc_eid", "ref_src", "si"}
+
+def canonical_url(url: str) -> str:
+    # Same page -> same string: https, lowercase host without www. or default
+    # port, no fragment, no tracking params, remaining params sorted.
+    try:
+        p = urlsplit((url or "").strip())
+        port = p.port
+    except ValueError:
+        return ""
+    if p.scheme.lower() not in ("http", "https") or not p.hostname:
+        return ""
+    host = p.hostname.rstrip(".")
+    try:
+        host = host.encode("idna").decode("ascii")
+    except UnicodeError:
+        pass
+    if host.startswith("www."):
+        host = host[4:]
+    if port and port not in (80, 443):
+        host = f"{host}:{port}"
+    path = p.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/")
+    query = sorted((k, v) for k, v in parse_qsl(p.query, keep_blank_values=True)
+                   if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS)
+    return urlunsplit(("https", host, path, urlencode(query), ""))
+
+def title_shingles(title: str) -> set:
+    # Character 3-grams of the folded title (works for CJK without a tokenizer).
+    t = unicodedata.normalize("NFKC", title or "").casefold()
+    t = " ".join("".join(c if c.isalnum() else " " for c in t).split())
+    if len(t) < 3:
+        return {t} if t else set()
+    return {t[i:i + 3] for i in range(len(t) - 2)}
+
+TITLE_HASH_P = (1 << 61) - 1
+_title_rng = random.Random(0x7F1E)
+TITLE_HASH_AB = [(_title_rng.randrange(1, TITLE_HASH_P), _title_rng.randrange(TITLE_HASH_P))
+                 for _ in range(TITLE_MINHASH_PERMS)]
+
+def title_band_keys(title: str) -> list[int]:
+    # MinHash signature of the shingles, cut into TITLE_LSH_BANDS bands; each
+    # band (with its number) hashes to one signed 64-bit key.
+    xs = [zlib.crc32(s.encode("utf-8")) for s in title_shingles(title)]
+    if not xs:
+        return []
+    P = TITLE_HASH_P
+    sig = [min((a * x + b) % P for x in xs) for a, b in TITLE_HASH_AB]
+    r = TITLE_MINHASH_PERMS // TITLE_LSH_BANDS
+    keys = []
+    for band in range(TITLE_LSH_BANDS):
+        raw = b"".join(v.to_bytes(8, "big") for v in (band, *sig[band * r:(band + 1) * r]))
+        keys.append(int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), "big", signed=True))
+    return keys
+
+def set_title_bands(tip_id: int, title: str) -> None:
+    keys = title_band_keys(title)
+    if keys:
+        db.session.execute(db.insert(TitleBand), [
+            {"tip_id": tip_id, "band": band, "key": key} for band, key in enumerate(keys)
+        ])
+
+def clear_title_bands(tip_ids: list) -> None:
+    db.session.execute(db.delete(TitleBand).where(TitleBand.tip_id.in_(tip_ids)))
+
+def similar_titles(title: str, limit: int = 5) -> list[tuple[int, str, float]]:
+    # [(tip id, title, Jaccard of shingles)] best first, above TITLE_SIM_MIN.
+    # One lookup of the title's band keys; cost follows the number of similar
+    # titles, not the table size.
+    keys = title_band_keys(title)
+    if not keys:
+        return []
+    rows = db.session.execute(
+        db.select(Tip.id, Tip.title).join(TitleBand, TitleBand.tip_id == Tip.id)
+        .where(TitleBand.key.in_(keys)).group_by(Tip.id, Tip.title)
+        .order_by(db.func.count().desc(), Tip.id.desc()).limit(TITLE_CANDIDATES)
+    ).all()
+    mine = title_shingles(title)
+    scored = []
+    for tip_id, other in rows:
+        theirs = title_shingles(other)
+        score = len(mine & theirs) / len(mine | theirs)
+        if score >= TITLE_SIM_MIN:
+            scored.append((tip_id, other, score))
+    scored.sort(key=lambda x: (-x[2], x[0]))
+    return scored[:limit]
+
+def already_posted(title: str, link_url: str) -> dict:
+    # {"link": tip with the same canonical link or None, "similar": [similar titles]}
+    canon = canonical_url(link_url)
+    link_dup = None
+    if canon:
+        link_dup = db.session.execute(db.select(Tip.id, Tip.title).where(Tip.link_canon == canon)).first()
+    similar = [{"id": i, "title": t, "score": round(score, 2)} for i, t, score in similar_titles(title)
+               if not link_dup or i != link_dup[0]] if title else []
+    return {
+        "link": {"id": link_dup[0], "title": link_dup[1]} if link_dup else None,
+        "similar": similar,
+    }
+
+# -----------------------------
+# Thumbnail jobs
+# -----------------------------
+class ThumbPipeline:
+    # One dispatcher thread per worker claims ThumbJob rows (conditional UPDATE,
+    # so several workers can drain the same table) and runs them in a process
+    # pool. All its DB writes go through run_write().
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pool = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._inflight = {}   # future -> (job_id, tip_id, thumb_rel)
+        self.done = 0
+        self.failed = 0
+
+    def ensure_started(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="thumb-dispatch", daemon=True)
+                self._thread.start()
+
+    def wake(self) -> None:
+        self.ensure_started()
+        self._wake.set()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _run(self) -> None:
+        while True:
+            try:
+                with app.app_context():
+                    self._claim_and_submit()
+                if self._inflight:
+                    finished, _ = wait(list(self._inflight), timeout=THUMB_POLL_S, return_when=FIRST_COMPLETED)
+                    with app.app_context():
+                        for fut in finished:
+                            self._finish(fut)
+                else:
+                    self._wake.wait(THUMB_POLL_S)
+                    self._wake.clear()
+            except Exception:
+                app.logger.exception("thumbnail dispatcher error")
+                time.sleep(THUMB_POLL_S)
+
+    def _claim_and_submit(self) -> None:
+        free = self.workers - len(self._inflight)
+        if free <= 0:
+            return
+        now = now_utc()
+        stale = now - timedelta(seconds=THUMB_JOB_TIMEOUT_S)
+        ready = db.or_(
+            db.and_(ThumbJob.state == "queued", ThumbJob.run_after <= now),
+            db.and_(ThumbJob.state == "running", ThumbJob.claimed_at < stale),
+        )
+        candidates = (db.session.query(ThumbJob.id, ThumbJob.tip_id, ThumbJob.blob_sha, ThumbJob.src_path)
+                      .filter(ready).order_by(ThumbJob.id).limit(free).all())
+        db.session.commit()
+        for job_id, tip_id, blob_sha, src_path in candidates:
+            claimed = run_write(lambda sess: sess.execute(
+                db.update(ThumbJob).where(ThumbJob.id == job_id, ready)
+                .values(state="running", claimed_at=now, attempts=ThumbJob.attempts + 1)
+            ).rowcount == 1)
+            if not claimed:
+                continue
+            stem = os.path.splitext(os.path.basename(src_path))[0]
+            src_abs = os.path.join(app.root_path, "static", src_path)
+            try:
+                fut = self._get_pool().submit(make_variants, src_abs, THUMB_DIR, stem)
+            except Exception:
+                # pool unusable: hand the job back and rebuild the pool next round
+                self._pool = None
+                run_write(lambda sess: sess.execute(
+                    db.update(ThumbJob).where(ThumbJob.id == job_id)
+                    .values(state="queued", attempts=ThumbJob.attempts - 1)
+                ).rowcount)
+                raise
+            self._inflight[fut] = (job_id, tip_id, blob_sha, src_path)
+
+    def _set_thumb(self, tip_id: int, blob_sha: Optional[str], **values) -> bool:
+        # Blob first (its row lock orders us after a submit that is still
+        # attaching a tip), then every tip that shares it.
+        if blob_sha:
+            if not db.session.execute(db.update(Blob).where(Blob.sha == blob_sha).values(**values)).rowcount:
+                return False
+            db.session.execute(db.update(Tip).where(Tip.blob_sha == blob_sha).values(**values))
+        else:
+            db.session.execute(db.update(Tip).where(Tip.id == tip_id).values(**values))
+        return True
+
+    def _finish(self, fut) -> None:
+        job_id, tip_id, blob_sha, src_path = self._inflight.pop(fut)
+        err = fut.exception()
+        if err is None:
+            meta = fut.result()
+            phash = meta.pop("dhash", None)
+            thumb_rel = f"thumbs/{os.path.splitext(os.path.basename(src_path))[0]}.jpg"
+
+            def store(sess):
+                live = self._set_thumb(tip_id, blob_sha, thumb_path=thumb_rel, thumb_state="ready",
+                                       thumb_meta=json.dumps(meta, separators=(",", ":")), phash=phash)
+                if live and phash:
+                    ids = ([i for (i,) in sess.execute(db.select(Tip.id).where(Tip.blob_sha == blob_sha))]
+                           if blob_sha else [tip_id])
+                    set_tip_phash(ids, phash)
+                sess.execute(db.delete(ThumbJob).where(ThumbJob.id == job_id))
+                return live
+            live = run_write(store)
+            if live is None:
+                return   # busy: the job stays claimed and is retried once stale
+            if not live:
+                # every tip let go of the blob while we were rendering it
+                run_write(lambda sess: collect_blob(sess, blob_sha, src_path))
+            self.done += 1
+            return
+
+        if isinstance(err, BrokenProcessPool):
+            self._pool = None
+
+        def record(sess):
+            job = sess.get(ThumbJob, job_id)
+            if not job:
+                return "gone"
+            job.last_error = f"{type(err).__name__}: {err}"[:255]
+            if job.attempts < THUMB_MAX_ATTEMPTS and not isinstance(err, PERMANENT_ERRORS):
+                job.state = "queued"
+                job.run_after = now_utc() + timedelta(seconds=2 ** job.attempts)
+            else:
+                job.state = "failed"
+                self._set_thumb(tip_id, blob_sha, thumb_state="failed")
+            return job.state
+        if run_write(record) == "failed":
+            self.failed += 1
+
+    def queue_depth(self) -> int:
+        return ThumbJob.query.filter(ThumbJob.state.in_(["queued", "running"])).count()
+
+    def stats(self) -> dict:
+        counts = dict(db.session.query(ThumbJob.state, db.func.count()).group_by(ThumbJob.state).all())
+        return {
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "failed": counts.get("failed", 0),
+            "max_queue": THUMB_QUEUE_MAX,
+            "worker_inflight": len(self._inflight),
+            "worker_done": self.done,
+            "worker_failed": self.failed,
+        }
+
+thumb_pipeline = ThumbPipeline(THUMB_WORKERS)
+
+@app.before_request
+def _start_thumb_pipeline():
+    thumb_pipeline.ensure_started()
+
+# -----------------------------
+# Feed
+# -----------------------------
+def encode_cursor(tab: str, key, tip_id: int) -> str:
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    raw = json.dumps([tab[0], key, tip_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(tab: str, cursor: str):
+    # Returns the (sort key, id) pair to continue after, or None if unusable.
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        t, key, tip_id = json.loads(raw)
+        if t != tab[0]:
+            return None
+        key = datetime.fromisoformat(key) if tab == "new" else float(key)
+        return key, int(tip_id)
+    except Exception:
+        return None
+
+def feed_ids(tab: str, cursor: str = "", limit: int = FEED_PAGE_SIZE, tag_id: Optional[int] = None):
+    # Keyset pagination: (created_at, id) for New, (hot_rank, id) for Hot.
+    # Tag pages walk the same keys copied into tip_tag.
+    src = TipTag if tag_id else Tip
+    id_col = TipTag.tip_id if tag_id else Tip.id
+    sort_col = src.created_at if tab == "new" else src.hot_rank
+    q = db.session.query(id_col, sort_col)
+    if tag_id:
+        q = q.filter(TipTag.tag_id == tag_id)
+    after = decode_cursor(tab, cursor) if cursor else None
+    if after:
+        q = q.filter(db.tuple_(sort_col, id_col) < after)
+    rows = q.order_by(sort_col.desc(), id_col.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        tip_id, key = rows[limit - 1]
+        next_cursor = encode_cursor(tab, key, tip_id)
+    return [r[0] for r in rows[:limit]], next_cursor
+
+class RankedFeedCache:
+    # Per-worker cache of the first ranked page (tip ids + next cursor) per key.
+    # Misses are single-flight per key; once an entry exists, expired or
+    # invalidated data keeps being served while one request refreshes it.
+    def __init__(self, ttl: float, max_keys: int):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._entries = {}   # key -> (value, expires_at, generation); tab or (tab, tag_id)
+        self._locks = {}
+        self._guard = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def _lock_for(self, key):
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _fresh(self, entry) -> bool:
+        return entry[1] > time.monotonic() and entry[2] == self._generation
+
+    def get(self, key, loader):
+        entry = self._entries.get(key)
+        if entry and self._fresh(entry):
+            self.hits += 1
+            return entry[0]
+
+        lock = self._lock_for(key)
+        if entry:
+            if not lock.acquire(blocking=False):
+                self.stale_hits += 1
+                return entry[0]
+        else:
+            lock.acquire()
+        try:
+            entry = self._entries.get(key)
+            if entry and self._fresh(entry):
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+            value = loader()
+            # an invalidate() during the load leaves this entry already stale
+            self._entries[key] = (value, time.monotonic() + self.ttl, generation)
+            if len(self._entries) > self.max_keys:
+                with self._guard:
+                    oldest = next(iter(self._entries))
+                    if oldest != key:
+                        self._entries.pop(oldest, None)
+            return value
+        finally:
+            lock.release()
+
+    def invalidate(self, key=None):
+        with self._guard:
+            if key is None:
+                self._generation += 1
+                return
+            for k in [k for k in self._entries if k == key or (isinstance(k, tuple) and k[0] == key)]:
+                value, _, generation = self._entries[k]
+                self._entries[k] = (value, 0.0, generation)
+
+    def stats(self) -> dict:
+        total = self.hits + self.stale_hits + self.misses
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.stale_hits) / total, 4) if total else 0.0,
+            "ttl": self.ttl,
+            "keys": len(self._entries),
+        }
+
+feed_cache = RankedFeedCache(FEED_CACHE_TTL, FEED_CACHE_MAX_KEYS)
+
+class VoteBuffer:
+    # Accumulates tip counter and author point deltas and applies them in one
+    # transaction every flush_ms or flush_events votes, whichever comes first.
+    def __init__(self, flush_ms: int, flush_events: int):
+        self.flush_s = flush_ms / 1000.0
+        self.flush_events = flush_events
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._tips = {}     # tip_id -> [d_likes, d_dislikes]
+        self._points = {}   # user_id -> d_points
+        self._events = 0
+        self._wake = threading.Event()
+        self._thread = None
+        self.flushes = 0
+
+    def add(self, tip_id: int, d_likes: int, d_dislikes: int, points: dict) -> None:
+        with self._lock:
+            t = self._tips.setdefault(tip_id, [0, 0])
+            t[0] += d_likes
+            t[1] += d_dislikes
+            for uid, d in points.items():
+                if d:
+                    self._points[uid] = self._points.get(uid, 0) + d
+            self._events += 1
+            if self._events >= self.flush_events:
+                self._wake.set()
+        self._ensure_thread()
+
+    def pending(self, tip_id: int):
+        t = self._tips.get(tip_id)
+        return (t[0], t[1]) if t else (0, 0)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="vote-buffer", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_s)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                app.logger.exception("vote buffer flush failed")
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                tips, self._tips = self._tips, {}
+                points, self._points = self._points, {}
+                self._events = 0
+            if not tips and not points:
+                return
+            done = None
+            try:
+                with app.app_context():
+                    done = run_write(lambda sess: self._apply(sess, tips, points))
+            finally:
+                if done is None:
+                    # failed or stayed busy: put the deltas back so the next flush retries them
+                    with self._lock:
+                        for tip_id, (dl, dd) in tips.items():
+                            t = self._tips.setdefault(tip_id, [0, 0])
+                            t[0] += dl
+                            t[1] += dd
+                        for uid, d in points.items():
+                            self._points[uid] = self._points.get(uid, 0) + d
+            if done is None:
+                return
+            self.flushes += 1
+            feed_cache.invalidate("hot")
+
+    @staticmethod
+    def _apply(sess, tips: dict, points: dict) -> bool:
+        for tip_id, (dl, dd) in tips.items():
+            if dl or dd:
+                bump_tip_counts(tip_id, dl, dd)
+        add_points(points)
+        return True
+
+vote_buffer = VoteBuffer(VOTE_FLUSH_MS, VOTE_FLUSH_EVENTS) if VOTE_WRITE_BEHIND else None
+if vote_buffer:
+    atexit.register(vote_buffer.flush)
+
+def live_counts(tip: Tip):
+    # Stored counts plus this worker's not-yet-flushed deltas. Either can be
+    # briefly negative while other workers' buffers are unflushed.
+    likes, dislikes = tip.likes_count or 0, tip.dislikes_count or 0
+    if vote_buffer:
+        dl, dd = vote_buffer.pending(tip.id)
+        likes, dislikes = likes + dl, dislikes + dd
+    return max(likes, 0), max(dislikes, 0)
+
+def publish_event(kind: str, tip_id: int, data: dict) -> None:
+    # Written in the caller's transaction, so rolled-back work never streams.
+    db.session.add(StreamEvent(kind=kind, tip_id=tip_id, data=json.dumps(data, separators=(",", ":"))))
+
+def stream_message(row) -> str:
+    # the id lets EventSource resume with Last-Event-ID after a reconnect
+    return f"id: {row.id}\nevent: {row.kind}\ndata: {row.data}\n\n"
+
+def stream_backlog(last_id: int, tip_ids: set) -> list:
+    # Events a reconnecting page missed, still in the log (SSE_EVENT_TTL_S).
+    with app.app_context():
+        rows = (db.session.query(StreamEvent.id, StreamEvent.kind, StreamEvent.tip_id, StreamEvent.data)
+                .filter(StreamEvent.id > last_id).order_by(StreamEvent.id).limit(SSE_QUEUE_SIZE).all())
+        db.session.commit()
+    return [stream_message(r) for r in rows if r.kind != "vote" or r.tip_id in tip_ids]
+
+class StreamSubscriber:
+    __slots__ = ("queue", "tip_ids")
+
+    def __init__(self, size: int, tip_ids: set):
+        self.queue = queue.Queue(size)
+        self.tip_ids = tip_ids
+
+class StreamHub:
+    # One poller thread per worker tails StreamEvent and fans out to bounded
+    # per-connection queues; connections never touch the database.
+    def __init__(self, poll_ms: int, queue_size: int):
+        self.poll_s = poll_ms / 1000.0
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subs = set()
+        self._thread = None
+        self._tail = IdTail()
+        self._last_prune = 0.0
+
+    def max_clients(self) -> int:
+        # a thread per stream under gthread, a greenlet under gevent
+        return SSE_MAX_CLIENTS or (900 if evented() else 24)
+
+    def subscribe(self, tip_ids: set):
+        with self._lock:
+            if len(self._subs) >= self.max_clients():
+                return None
+            sub = StreamSubscriber(self.queue_size, tip_ids)
+            self._subs.add(sub)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="sse-hub", daemon=True)
+                self._thread.start()
+        return sub
+
+    def unsubscribe(self, sub) -> None:
+        with self._lock:
+            self._subs.discard(sub)
+
+    def client_count(self) -> int:
+        return len(self._subs)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.poll_s)
+            try:
+                self._poll()
+            except Exception:
+                app.logger.exception("stream poll failed")
+
+    def _poll(self) -> None:
+        if not self._subs:
+            self._tail.reset(None)
+            return
+        # sqlite3 blocks in C, so under gevent the database side runs off the loop
+        rows = off_loop(self._fetch)
+        with self._lock:
+            subs = list(self._subs)
+        for r in rows:
+            msg = stream_message(r)
+            for sub in subs:
+                if r.kind == "vote" and r.tip_id not in sub.tip_ids:
+                    continue
+                try:
+                    sub.queue.put_nowait(msg)
+                except queue.Full:
+                    # slow client: drop its oldest event, counts are superseded anyway
+                    try:
+                        sub.queue.get_nowait()
+                        sub.queue.put_nowait(msg)
+                    except (queue.Empty, queue.Full):
+                        pass
+
+    def _fetch(self) -> list:
+        with app.app_context():
+            if self._tail.last_id is None:
+                self._tail.reset(db.session.query(db.func.max(StreamEvent.id)).scalar() or 0)
+            rows = (db.session.query(StreamEvent.id, StreamEvent.kind, StreamEvent.tip_id, StreamEvent.data)
+                    .filter(self._tail.condition(StreamEvent.id)).order_by(StreamEvent.id).limit(500).all())
+            self._tail.advance([r.id for r in rows])
+            db.session.commit()
+            if time.monotonic() - self._last_prune > 60:
+                self._last_prune = time.monotonic()
+                cutoff = now_utc() - timedelta(seconds=SSE_EVENT_TTL_S)
+                run_write(lambda sess: sess.execute(db.delete(StreamEvent).where(StreamEvent.created_at < cutoff)).rowcount)
+        return rows
+
+stream_hub = StreamHub(SSE_POLL_MS, SSE_QUEUE_SIZE)
+
+def hydrate_tips(ids: list) -> list:
+    # Ranking only touched (id, sort key); full rows and their authors are
+    # loaded here, for the rendered page only, in a single joined SELECT.
+    if not ids:
+        return []
+    q = Tip.query.options(db.joinedload(Tip.author)).filter(Tip.id.in_(ids))
+    by_id = {t.id: t for t in q.all()}
+    return [by_id[i] for i in ids if i in by_id]
+
+def feed_page(tab: str, cursor: str = "", tag_id: Optional[int] = None):
+    if cursor:
+        ids, next_cursor = feed_ids(tab, cursor, tag_id=tag_id)
+    else:
+        key = (tab, tag_id) if tag_id else tab
+        ids, next_cursor = feed_cache.get(key, lambda: feed_ids(tab, tag_id=tag_id))
+    return hydrate_tips(ids), next_cursor
+
+def viewer_votes(me: Optional[UserSnapshot], tip_ids: list):
+    # Vote state for just the tips on the page, served by ix_vote_user_tip.
+    if not me or not tip_ids:
+        return set(), set()
+    q = db.select(Vote.tip_id, Vote.value).where(
+        Vote.user_id == me.id, Vote.tip_id.in_(tip_ids), Vote.value != 0
+    )
+    my_likes = set()
+    my_dislikes = set()
+    for tip_id, v in db.session.execute(q):
+        (my_likes if v > 0 else my_dislikes).add(tip_id)
+    return my_likes, my_dislikes
+
+def tip_images(tip: Tip) -> Optional[dict]:
+    # <img>/<picture> data for a card: fallback src, lightbox image, srcset per
+    # format (best first) and intrinsic size when variants exist.
+    thumb = tip.thumb_path or tip.upload_path
+    if not thumb:
+        return None
+    img = {
+        "src": url_for("static", filename=thumb),
+        "full": url_for("static", filename=tip.upload_path or thumb),
+        "w": None,
+        "h": None,
+        "sources": [],
+    }
+    try:
+        meta = json.loads(tip.thumb_meta) if tip.thumb_meta and tip.thumb_path else None
+    except ValueError:
+        meta = None
+    if meta:
+        base = os.path.splitext(tip.thumb_path)[0]
+        for fmt in meta["fmts"]:
+            srcset = ", ".join(f"{url_for('static', filename=f'{base}-{w}.{fmt}')} {w}w" for w in meta["widths"])
+            img["sources"].append({"type": f"image/{fmt}", "srcset": srcset})
+        img["full"] = url_for("static", filename=f"{base}-{meta['widths'][-1]}.webp")
+        img["w"], img["h"] = meta["w"], meta["h"]
+    return img
+
+def tip_json(tip: Tip, my_likes: set, my_dislikes: set) -> dict:
+    likes, dislikes = live_counts(tip)
+    return {
+        "id": tip.id,
+        "title": tip.title,
+        "link": tip.link_url or "",
+        "image": tip.image_url or "",
+        "img": tip_images(tip),
+        "tags": tip.tags or "",
+        "tag_list": parse_tags(tip.tags),
+        "note": tip.note or "",
+        "dup_of": tip.near_dup_of,
+        "author": tip.author.handle,
+        "created": tip.created_at.strftime("%Y-%m-%d %H:%M"),
+        "likes": likes,
+        "dislikes": dislikes,
+        "v": 1 if tip.id in my_likes else (-1 if tip.id in my_dislikes else 0),
+    }
+
+# -----------------------------
+# Writes
+# -----------------------------
+# A write is a callable fn(session) that does its work without committing and
+# returns a result, or None when it wrote nothing and should be retried (a
+# concurrent vote won). Work that must wait for the commit (caches, in-memory
+# indexes, waking threads) is registered with after_commit(). Helpers that use
+# db.session inside fn see the same session.
+def after_commit(cb) -> None:
+    db.session.info.setdefault("after_commit", []).append(cb)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_commit(sess):
+    sess.info.pop("after_commit", None)
+
+def run_after_commit(sess) -> None:
+    for cb in sess.info.pop("after_commit", []):
+        try:
+            cb()
+        except Exception:
+            app.logger.exception("after-commit callback failed")
+
+def is_busy(e: Exception) -> bool:
+    return isinstance(e, OperationalError) and "locked" in str(e).lower()
+
+def call_write(fn):
+    for _ in range(WRITE_RETRIES):
+        result = fn(db.session)
+        if result is not None:
+            return result
+    return None
+
+def run_write(fn):
+    # Returns fn's result once committed, or None if the database stayed busy.
+    # Exceptions raised by fn reach the caller after a rollback.
+    if write_queue:
+        # don't pin a pooled connection while waiting on the writer
+        db.session.close()
+        return write_queue.submit(copy_current_request_context(fn) if has_request_context() else fn)
+    for _ in range(WRITE_RETRIES):
+        try:
+            result = fn(db.session)
+            if result is not None:
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if not is_busy(e):
+                raise
+            result = None
+        if result is not None:
+            run_after_commit(db.session)
+            return result
+        db.session.rollback()
+    return None
+
+class WriteQueue:
+    # One writer thread per worker. Callers block while their fn runs on the
+    # writer's session; calls that queue up meanwhile share one transaction
+    # (group commit), so a burst costs one fsync instead of one each. A call
+    # that raises is dropped and the rest of its batch is run again.
+    def __init__(self, batch_max: int, wait_ms: float):
+        self.batch_max = batch_max
+        self.wait_s = wait_ms / 1000.0
+        self._q = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.calls = 0
+
+    def submit(self, fn):
+        fut = Future()
+        self._q.put((fn, fut))
+        self._ensure_thread()
+        return fut.result()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._q.get()]
+            deadline = time.monotonic() + self.wait_s
+            while len(batch) < self.batch_max:
+                try:
+                    batch.append(self._q.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            with app.app_context():
+                db.session.info["writer"] = True
+                try:
+                    self._commit(batch)
+                except Exception as e:
+                    app.logger.exception("writer batch failed")
+                    for _, fut in batch:
+                        if not fut.done():
+                            fut.set_exception(e)
+
+    def _commit(self, batch: list) -> None:
+        busy = 0
+        while batch:
+            results = []
+            try:
+                for fn, _ in batch:
+                    results.append(call_write(fn))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                if is_busy(e):
+                    busy += 1
+                    if busy < WRITE_RETRIES:
+                        continue
+                    for _, fut in batch:
+                        fut.set_result(None)
+                    return
+                if len(results) == len(batch):
+                    raise   # the commit itself failed
+                batch[len(results)][1].set_exception(e)
+                del batch[len(results)]
+                continue
+            run_after_commit(db.session)
+            self.batches += 1
+            self.calls += len(batch)
+            for (_, fut), result in zip(batch, results):
+                fut.set_result(result)
+            return
+
+write_queue = WriteQueue(WRITE_BATCH_MAX, WRITE_BATCH_WAIT_MS) if SINGLE_WRITER else None
+
+def read_only(view):
+    # Routes that never write query through the mode=ro pool in single-writer mode.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        db.session.info["read_only"] = True
+        return view(*args, **kwargs)
+    return wrapper
+
+def make_single_writer_engines():
+    # A read-only pool for read_only() routes, which WAL lets read while the
+    # writer holds the write lock, and one dedicated connection for the writer
+    # thread so it never waits on a pool drained by blocked requests.
+    url = db.engine.url
+    if url.get_backend_name() != "sqlite" or not url.database or url.database == ":memory:":
+        return None, None
+    reader = create_engine(f"sqlite:///file:{url.database}?mode=ro&uri=true",
+                           connect_args={"check_same_thread": False})
+    writer = create_engine(url, pool_size=1, max_overflow=0, connect_args={"check_same_thread": False})
+    for engine in (reader, writer):
+        event.listen(engine, "connect", sqlite_connect)
+    return reader, writer
+
+# -----------------------------
+# Archive
+# -----------------------------
+ARCHIVE_COLUMNS = ("id", "title", "link_url", "image_url", "upload_path", "thumb_path", "thumb_state",
+                   "thumb_meta", "tags", "note", "author_id", "created_at", "likes_count", "dislikes_count",
+                   "blob_sha", "near_dup_of", "link_canon")
+
+def cold_tip_ids(cutoff: datetime, limit: int):
+    # Oldest first, off ix_tip_created_at. A live tip whose id is already
+    # archived (reused before tip had AUTOINCREMENT) can't be moved; it stays.
+    return (db.select(Tip.id)
+            .where(Tip.created_at < cutoff, ~db.exists().where(ArchivedTip.id == Tip.id))
+            .order_by(Tip.created_at).limit(limit))
+
+def archive_chunk(sess, ids: list) -> int:
+    # One transaction: copy the tips, then drop them and their votes and tag
+    # rows. Blob references move with the tip; a blob's thumbnail job stays,
+    # since its result goes to the blob and every live tip sharing it. Only
+    # the tips actually copied are dropped: one another worker archived first,
+    # or whose id an archived row already holds, is left alone.
+    cols = [getattr(Tip, c) for c in ARCHIVE_COLUMNS]
+    src = db.select(*cols, db.bindparam("archived_at", now_utc(), type_=db.DateTime)).where(Tip.id.in_(ids))
+    insert = native_insert(ArchivedTip)
+    if insert is not None and db.engine.dialect.insert_returning:
+        stmt = (insert.from_select([*ARCHIVE_COLUMNS, "archived_at"], src)
+                .on_conflict_do_nothing().returning(ArchivedTip.id))
+        ids = [i for (i,) in sess.execute(stmt)]
+        if not ids:
+            return 0
+    else:
+        # no ON CONFLICT here: an id clash raises and rolls the chunk back
+        sess.execute(db.insert(ArchivedTip).from_select([*ARCHIVE_COLUMNS, "archived_at"], src))
+    sess.execute(db.delete(Vote).where(Vote.tip_id.in_(ids)))
+    tags = clear_tip_tags(ids)
+    sess.execute(db.delete(ThumbJob).where(ThumbJob.tip_id.in_(ids), ThumbJob.blob_sha.is_(None)))
+    clear_title_bands(ids)
+    n = sess.execute(db.delete(Tip).where(Tip.id.in_(ids))).rowcount
+
+    def archived():
+        feed_cache.invalidate()
+        for name, k in tags.items():
+            tag_suggest.bump([name], -k)
+    after_commit(archived)
+    return n
+
+def archive_cold_tips(max_chunks: Optional[int] = None) -> int:
+    # Chunk by chunk, each its own short write, until nothing is old enough.
+    cutoff = now_utc() - timedelta(hours=ARCHIVE_AFTER_HOURS)
+    if vote_buffer:
+        vote_buffer.flush()   # fold this worker's pending counts in first
+    done = chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        ids = [i for (i,) in db.session.execute(cold_tip_ids(cutoff, ARCHIVE_CHUNK))]
+        if not ids:
+            break
+        n = run_write(lambda sess: archive_chunk(sess, ids))
+        if n is None:
+            break   # busy; the next run picks up from here
+        done += n
+        chunks += 1
+        time.sleep(ARCHIVE_PAUSE_MS / 1000.0)
+    return done
+
+class Archiver:
+    # Optional per-worker thread running archive_cold_tips() every interval;
+    # concurrent runs in other workers skip rows that are already gone.
+    def __init__(self, interval_s: float):
+        self.interval_s = interval_s
+        self._lock = threading.Lock()
+        self._thread = None
+        self.archived = 0
+
+    def ensure_started(self) -> None:
+        if self.interval_s <= 0:
+            return
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="archiver", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval_s)
+            try:
+                with app.app_context():
+                    self.archived += archive_cold_tips()
+            except Exception:
+                app.logger.exception("archival run failed")
+
+archiver = Archiver(ARCHIVE_INTERVAL_S)
+
+@app.before_request
+def _start_archiver():
+    archiver.ensure_started()
+
+# -----------------------------
+# Search
+# -----------------------------
+search_fts = False   # set at startup by has_search_index()
+
+def has_search_index() -> bool:
+    if db.engine.dialect.name != "sqlite":
+        return False
+    return db.session.execute(db.text("SELECT 1 FROM sqlite_master WHERE name = 'tip_fts'")).first() is not None
+
+def search_terms(q: str) -> list[str]:
+    return re.findall(r"\w+", unicodedata.normalize("NFKC", q or "").casefold())[:8]
+
+def encode_search_cursor(sort: str, offset: int) -> str:
+    raw = json.dumps(["s", sort, offset], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_search_cursor(sort: str, cursor: str) -> Optional[int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        k, s, offset = json.loads(raw)
+        return int(offset) if k == "s" and s == sort and 0 <= int(offset) <= SEARCH_MAX_OFFSET else None
+    except Exception:
+        return None
+
+def search_ids(terms: list[str], sort: str, offset: int, limit: int = SEARCH_PAGE_SIZE,
+               window: int = SEARCH_WINDOW) -> list[int]:
+    # sort: "rel" = bm25 (title > tags > note), "hot" = bm25 blended with hot_rank.
+    # Returns up to limit + 1 ids so the caller can tell whether a next page exists.
+    if search_fts:
+        # Only the newest `window` matches are scored (0 = every match): FTS5
+        # walks a doclist by rowid cheaply, while bm25 over every match of a
+        # common word at 1M rows takes seconds. An older tip that only matches
+        # common words is therefore not found; see benchmarks/search_p99.py.
+        # Terms are quoted, so users can't inject FTS syntax.
+        match = " ".join(f'"{t}"' for t in terms)
+        rank = "bm25(tip_fts, 3.0, 1.0, 2.0)"
+        if window > 0:
+            window_cte = "WITH w AS (SELECT rowid AS r FROM tip_fts WHERE tip_fts MATCH :m ORDER BY rowid DESC LIMIT :win) "
+            scope = "tip_fts MATCH :m AND tip_fts.rowid >= (SELECT min(r) FROM w)"
+        else:
+            window_cte, scope = "", "tip_fts MATCH :m"
+        if sort == "hot":
+            sql = (f"{window_cte}SELECT tip.id FROM tip_fts JOIN tip ON tip.id = tip_fts.rowid WHERE {scope} "
+                   f"ORDER BY {rank} - :w * tip.hot_rank LIMIT :l OFFSET :o")
+        else:
+            sql = f"{window_cte}SELECT tip_fts.rowid FROM tip_fts WHERE {scope} ORDER BY {rank} LIMIT :l OFFSET :o"
+        params = {"m": match, "win": window, "w": SEARCH_HOT_WEIGHT, "l": limit + 1, "o": offset}
+        return [r[0] for r in db.session.execute(db.text(sql), params)]
+
+    # Fallback: every term must appear in title, note or tags; no relevance, hot order.
+    conds = []
+    for t in terms:
+        pat = "%" + t.replace("_", "\\_") + "%"   # terms are \w+, so "_" is the only wildcard
+        conds.append(db.or_(*(col.ilike(pat, escape="\\") for col in (Tip.title, Tip.note, Tip.tags))))
+    q = (db.select(Tip.id).where(*conds).order_by(Tip.hot_rank.desc(), Tip.id.desc())
+         .offset(offset).limit(limit + 1))
+    return [r[0] for r in db.session.execute(q)]
+
+SQLITE_PRAGMA_CHOICES = {
+    "journal_mode": ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"),
+    "synchronous": ("OFF", "NORMAL", "FULL", "EXTRA"),
+    "temp_store": ("DEFAULT", "FILE", "MEMORY"),
+}
+
+def sqlite_pragmas() -> list[str]:
+    values = {"journal_mode": SQLITE_JOURNAL_MODE, "synchronous": SQLITE_SYNCHRONOUS,
+              "temp_store": SQLITE_TEMP_STORE}
+    for name, value in values.items():
+        if value not in SQLITE_PRAGMA_CHOICES[name]:
+            raise RuntimeError(f"SQLITE_{name.upper()}={value!r}; expected one of {SQLITE_PRAGMA_CHOICES[name]}")
+    return [
+        # busy_timeout first: switching to WAL needs a lock another worker may hold
+        f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}",
+        f"PRAGMA temp_store = {SQLITE_TEMP_STORE}",
+        f"PRAGMA mmap_size = {SQLITE_MMAP_MB * 1024 * 1024}",
+        f"PRAGMA cache_size = {-SQLITE_CACHE_MB * 1024}",   # negative = KiB
+    ]
+
+def sqlite_connect(dbapi_conn, _record) -> None:
+    if db.engine.dialect.name != "sqlite":
+        return
+    dbapi_conn.create_function("logaddexp2", 2, logaddexp2, deterministic=True)
+    dbapi_conn.create_function("phash_distance", 2, phash_distance, deterministic=True)
+    dbapi_conn.create_function("calc_hot_rank", 3, calc_hot_rank_stored, deterministic=True)
+    cur = dbapi_conn.cursor()
+    try:
+        for pragma in SQLITE_PRAGMAS:
+            cur.execute(pragma)
+    finally:
+        cur.close()
+
+SQLITE_PRAGMAS = sqlite_pragmas()
+
+with app.app_context():
+    event.listen(db.engine, "connect", sqlite_connect)
+    run_migrations()
+    search_fts = has_search_index()
+    if not search_fts and db.engine.dialect.name == "sqlite":
+        app.logger.warning("tip_fts is missing; search falls back to LIKE scans")
+    if SINGLE_WRITER:
+        read_engine, write_engine = make_single_writer_engines()
+
+def _drop_inherited_connections() -> None:
+    # A child forked after import (gunicorn --preload) must not reuse the
+    # parent's pooled connections; it opens its own on first use.
+    with app.app_context():
+        db.engine.dispose(close=False)
+    for engine in (read_engine, write_engine):
+        if engine is not None:
+            engine.dispose(close=False)
+
+os.register_at_fork(after_in_child=_drop_inherited_connections)
 
 # -----------------------------
 # Routes
 # -----------------------------
 @app.get("/")
+@read_only
 def home():
     lang = get_lang()
     tab = (request.args.get("tab") or "hot").lower()
@@ -433,16 +2867,14 @@ def home():
         tab = "hot"
 
     me = get_user()
+    tag = normalize_tag(request.args.get("tag") or "")
+    tag_id = tag_id_for(tag)
 
-    tips = Tip.query.order_by(Tip.created_at.desc()).limit(200).all()
-    tips_sorted = tips if tab == "new" else sorted(tips, key=hot_score, reverse=True)
-    tips_sorted = tips_sorted[:50]
-
-    my_likes = set()
-    my_dislikes = set()
-    if me:
-        my_likes = {r.tip_id for r in Like.query.filter_by(user_id=me.id).all()}
-        my_dislikes = {r.tip_id for r in Dislike.query.filter_by(user_id=me.id).all()}
+    if tag and not tag_id:
+        tips_sorted, next_cursor = [], None
+    else:
+        tips_sorted, next_cursor = feed_page(tab, tag_id=tag_id)
+    my_likes, my_dislikes = viewer_votes(me, [t.id for t in tips_sorted])
 
     resp = make_response(render_template(
         "index.html",
@@ -452,10 +2884,18 @@ def home():
         T=I18N[lang],
         lang=lang,
         tab=tab,
+        tag=tag,
         me=me,
         tips=tips_sorted,
+        next_cursor=next_cursor or "",
+        dup_id=request.args.get("dup", type=int),
         my_likes=my_likes,
         my_dislikes=my_dislikes,
+        live_counts=live_counts,
+        tip_images=tip_images,
+        parse_tags=parse_tags,
+        trending=trending_tags.top(),
+        THUMB_SIZES=THUMB_SIZES,
         POINTS_PER_TOKEN=POINTS_PER_TOKEN,
         TOKEN_SUPPLY=TOKEN_SUPPLY,
         REWARD_SUBMIT=REWARD_SUBMIT,
@@ -463,10 +2903,157 @@ def home():
         REWARD_LIKE_GIVEN=REWARD_LIKE_GIVEN,
         REWARD_DISLIKE_GIVEN=REWARD_DISLIKE_GIVEN,
         CHECKIN_MAX_STREAK=CHECKIN_MAX_STREAK,
+        STREAM_URL=STREAM_URL,
     ))
     resp.set_cookie("lang", lang, max_age=60 * 60 * 24 * 365, samesite="Lax")
     return resp
 
+@app.get("/tip/<int:tip_id>")
+@read_only
+def tip_page(tip_id: int):
+    lang = get_lang()
+    tip = db.session.get(Tip, tip_id)
+    archived = tip is None
+    if archived:
+        tip = db.session.get(ArchivedTip, tip_id)
+    if not tip:
+        abort(404)
+    return render_template(
+        "tip.html",
+        APP_NAME=APP_NAME,
+        TOKEN_SYMBOL=TOKEN_SYMBOL,
+        T=I18N[lang],
+        lang=lang,
+        me=get_user(),
+        tip=tip,
+        archived=archived,
+        counts=(max(tip.likes_count or 0, 0), max(tip.dislikes_count or 0, 0)) if archived else live_counts(tip),
+        img=tip_images(tip),
+        parse_tags=parse_tags,
+        THUMB_SIZES=THUMB_SIZES,
+        CHECKIN_MAX_STREAK=CHECKIN_MAX_STREAK,
+    )
+
+@app.get("/api/tags/suggest")
+def api_tags_suggest():
+    limit = min(max(request.args.get("limit", TAG_SUGGEST_LIMIT, type=int), 1), 20)
+    tags = tag_suggest.suggest(request.args.get("q") or "", limit)
+    return jsonify({"ok": True, "tags": [{"name": n, "count": c} for n, c in tags]})
+
+@app.get("/api/tags/trending")
+def api_tags_trending():
+    return jsonify({"ok": True, "tags": trending_tags.top()})
+
+@app.get("/api/search")
+@read_only
+def api_search():
+    terms = search_terms(request.args.get("q") or "")
+    if not terms:
+        return jsonify({"ok": False, "code": "EMPTY_QUERY"}), 400
+    sort = (request.args.get("sort") or "rel").lower()
+    if sort not in ["rel", "hot"]:
+        return jsonify({"ok": False, "code": "BAD_SORT"}), 400
+    cursor = (request.args.get("cursor") or "").strip()
+    offset = decode_search_cursor(sort, cursor) if cursor else 0
+    if offset is None:
+        return jsonify({"ok": False, "code": "BAD_CURSOR"}), 400
+
+    ids = search_ids(terms, sort, offset)
+    next_cursor = None
+    if len(ids) > SEARCH_PAGE_SIZE and offset + SEARCH_PAGE_SIZE <= SEARCH_MAX_OFFSET:
+        next_cursor = encode_search_cursor(sort, offset + SEARCH_PAGE_SIZE)
+    me = get_user()
+    tips = hydrate_tips(ids[:SEARCH_PAGE_SIZE])
+    my_likes, my_dislikes = viewer_votes(me, [t.id for t in tips])
+    return jsonify({
+        "ok": True,
+        "sort": sort,
+        "backend": "fts5" if search_fts else "like",
+        "items": [tip_json(t, my_likes, my_dislikes) for t in tips],
+        "next": next_cursor,
+    })
+
+@app.get("/api/similar")
+def api_similar():
+    title = (request.args.get("title") or "").strip()[:140]
+    link_url = (request.args.get("link") or "").strip()[:500]
+    return jsonify({"ok": True, **already_posted(title, link_url)})
+
+@app.get("/api/feed")
+@read_only
+def api_feed():
+    tab = (request.args.get("tab") or "hot").lower()
+    if tab not in ["hot", "new"]:
+        return jsonify({"ok": False, "code": "BAD_TAB"}), 400
+    cursor = (request.args.get("cursor") or "").strip()
+    if cursor and not decode_cursor(tab, cursor):
+        return jsonify({"ok": False, "code": "BAD_CURSOR"}), 400
+
+    tag = normalize_tag(request.args.get("tag") or "")
+    tag_id = tag_id_for(tag)
+
+    me = get_user()
+    tips, next_cursor = feed_page(tab, cursor, tag_id) if tag_id or not tag else ([], None)
+    my_likes, my_dislikes = viewer_votes(me, [t.id for t in tips])
+    return jsonify({
+        "ok": True,
+        "tab": tab,
+        "tag": tag,
+        "items": [tip_json(t, my_likes, my_dislikes) for t in tips],
+        "next": next_cursor,
+    })
+
+@app.get("/api/stream")
+def api_stream():
+    tip_ids = set()
+    for part in (request.args.get("ids") or "").split(",")[:SSE_MAX_IDS]:
+        if part.strip().isdigit():
+            tip_ids.add(int(part))
+
+    # EventSource sends Last-Event-ID on its own reconnects; the page passes
+    # ?last= when it reopens the stream for a new set of ids
+    last = request.headers.get("Last-Event-ID") or request.args.get("last") or ""
+
+    sub = stream_hub.subscribe(tip_ids)
+    if sub is None:
+        resp = jsonify({"ok": False, "code": "BUSY"})
+        resp.headers["Retry-After"] = str(SSE_RETRY_AFTER_S)
+        return resp, 503
+    # subscribed first, so nothing falls between the backlog and the queue (the
+    # overlap is sent twice; counts and tip ids are idempotent on the page)
+    try:
+        backlog = off_loop(stream_backlog, int(last), tip_ids) if last.isdigit() else []
+    except Exception:
+        stream_hub.unsubscribe(sub)
+        raise
+
+    def gen():
+        q = sub.queue
+        try:
+            yield "retry: 5000\n\n"
+            yield from backlog
+            while True:
+                try:
+                    yield q.get(timeout=SSE_HEARTBEAT_S)
+                except queue.Empty:
+                    yield ": ping\n\n"
+        finally:
+            stream_hub.unsubscribe(sub)
+
+    resp = Response(gen(), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    resp.headers["Access-Control-Allow-Origin"] = "*"   # public counts; STREAM_URL may be another origin
+    return resp
+
+@app.get("/api/thumbs/status")
+def api_thumbs_status():
+    return jsonify({"ok": True, "thumbs": thumb_pipeline.stats()})
+
+@app.get("/api/feed/stats")
+def api_feed_stats():
+    return jsonify({"ok": True, "cache": feed_cache.stats(), "stream_clients": stream_hub.client_count()})
+
 @app.post("/login")
 def login():
     lang = get_lang()
@@ -476,25 +3063,57 @@ def login():
     if not handle or not password:
         return redirect(url_for("home", lang=lang, tab=tab))
 
-    u = User.query.filter_by(handle=handle).first()
+    account = db.select(User.id, User.password_hash, User.session_version).where(User.handle == handle)
+    u = db.session.execute(account).first()
+    uid = None
     if not u:
-        u = User(handle=handle, points=POINTS_START, password_hash=generate_password_hash(password))
-        db.session.add(u)
-        db.session.commit()
-    else:
+        password_hash = off_loop(generate_password_hash, password)
+
+        def create(sess):
+            user = User(handle=handle, points=POINTS_START, password_hash=password_hash)
+            sess.add(user)
+            sess.flush()
+            return user.id
+        try:
+            uid, version = run_write(create), 1
+        except IntegrityError:
+            pass   # a concurrent first login took the handle; verify against it instead
+        if uid is None:
+            u = db.session.execute(account).first()
+            if not u:
+                return redirect(url_for("home", lang=lang, tab=tab))   # busy
+    if uid is None:
         if not (u.password_hash or "").strip():
-            u.password_hash = generate_password_hash(password)
-            db.session.commit()
-        elif not check_password_hash(u.password_hash, password):
+            # claiming a legacy password-less handle revokes its old sessions
+            password_hash = off_loop(generate_password_hash, password)
+            version = (u.session_version or 1) + 1
+
+            def claim(sess):
+                mark_user_changed(u.id)
+                return sess.execute(
+                    db.update(User).where(User.id == u.id, db.func.trim(db.func.coalesce(User.password_hash, "")) == "")
+                    .values(password_hash=password_hash, session_version=version)
+                ).rowcount == 1
+            if not run_write(claim):
+                return redirect(url_for("home", lang=lang, tab=tab))   # busy, or claimed meanwhile
+        elif not off_loop(check_password_hash, u.password_hash, password):
             return redirect(url_for("home", lang=lang, tab=tab, bad_login=1))
+        else:
+            version = u.session_version or 1
+        uid = u.id
 
+    session.clear()
+    session.permanent = True
+    session["uid"] = uid
+    session["ver"] = version
     resp = make_response(redirect(url_for("home", lang=lang, tab=tab)))
-    resp.set_cookie("handle", u.handle, max_age=60 * 60 * 24 * 365, samesite="Lax")
+    resp.delete_cookie("handle")
     return resp
 
 @app.post("/logout")
 def logout():
     lang = get_lang()
+    session.clear()
     resp = make_response(redirect(url_for("home", lang=lang)))
     resp.delete_cookie("handle")
     return resp
@@ -513,43 +3132,96 @@ def submit():
     tags = (request.form.get("tags") or "").strip()
     note = (request.form.get("note") or "").strip()
 
-    upload_path = ""
-    thumb_path = ""
-
     f = request.files.get("image_file")
-    if f and f.filename:
-        fn = safe_filename(f.filename)
-        abs_up = os.path.join(UPLOAD_DIR, fn)
-        f.save(abs_up)
-        upload_path = f"uploads/{fn}"
-
-        thumb_fn = f"{os.path.splitext(fn)[0]}.jpg"
-        abs_th = os.path.join(THUMB_DIR, thumb_fn)
-        try:
-            make_thumb(abs_up, abs_th)
-            thumb_path = f"thumbs/{thumb_fn}"
-        except Exception:
-            thumb_path = ""
-
+    has_file = bool(f and f.filename)
     if not title:
         return redirect(url_for("home", lang=lang, tab=tab))
-    if not link_url and not image_url and not upload_path:
+    if not link_url and not image_url and not has_file:
         return redirect(url_for("home", lang=lang, tab=tab))
 
-    tip = Tip(
-        title=title,
-        link_url=link_url,
-        image_url=image_url,
-        upload_path=upload_path,
-        thumb_path=thumb_path,
-        tags=tags,
-        note=note,
-        author_id=me.id,
-    )
-    db.session.add(tip)
+    link_canon = canonical_url(link_url) or None
+    if link_canon:
+        dup = (db.session.execute(db.select(Tip.id).where(Tip.link_canon == link_canon)).scalar()
+               or db.session.execute(db.select(ArchivedTip.id).where(ArchivedTip.link_canon == link_canon)).scalar())
+        if dup:
+            return redirect(url_for("home", lang=lang, tab=tab, dup=dup))
+
+    blob_sha, upload_tmp, upload_path = store_upload(f) if has_file else (None, None, "")
+    tag_names = parse_tags(tags)
+
+    def insert_tip(sess):
+        created_at = now_utc()
+        tip = Tip(
+            title=title,
+            link_url=link_url,
+            link_canon=link_canon,
+            image_url=image_url,
+            upload_path=upload_path,
+            thumb_path="",
+            blob_sha=blob_sha,
+            tags=tags,
+            note=note,
+            author_id=me.id,
+            created_at=created_at,
+            likes_count=0,
+            dislikes_count=0,
+            hot_rank=calc_hot_rank(0, 0, created_at),
+        )
+        sess.add(tip)
+        sess.flush()
+
+        queued = False
+        if blob_sha:
+            blob = acquire_blob(blob_sha, upload_path)
+            # same bytes may be stored under another extension: keep the blob's name
+            place_upload(upload_tmp, blob.upload_path)
+            # thumbnails are made once per blob, in the background; past the queue
+            # cap the feed simply keeps showing the original upload
+            if blob.thumb_state in ("", "skipped"):
+                state = "pending" if thumb_pipeline.queue_depth() < THUMB_QUEUE_MAX else "skipped"
+                queued = state == "pending" and sess.execute(
+                    db.update(Blob).where(Blob.sha == blob_sha, Blob.thumb_state.in_(["", "skipped"]))
+                    .values(thumb_state="pending")).rowcount == 1
+                if queued:
+                    sess.add(ThumbJob(tip_id=tip.id, blob_sha=blob_sha, src_path=blob.upload_path))
+                sess.refresh(blob)
+            tip.upload_path = blob.upload_path
+            tip.thumb_path = blob.thumb_path or ""
+            tip.thumb_state = blob.thumb_state or "skipped"
+            tip.thumb_meta = blob.thumb_meta or ""
+            if blob.phash:
+                # same content seen before: the hash is known, link the repost now
+                sess.flush()
+                set_tip_phash([tip.id], blob.phash)
+
+        set_tip_tags(tip.id, tag_names, created_at, tip.hot_rank)
+        set_title_bands(tip.id, title)
+        add_points({me.id: REWARD_SUBMIT})
+        publish_event("tip", tip.id, tip_json(tip, set(), set()))
+        tip_id = tip.id
+
+        def published():
+            feed_cache.invalidate()
+            trending_tags.record(tag_names, TREND_W_SUBMIT, created_at)
+            tag_suggest.bump(tag_names, 1)
+            if queued:
+                thumb_pipeline.wake()
+        after_commit(published)
+        return tip_id
 
-    me.points += REWARD_SUBMIT
-    db.session.commit()
+    try:
+        tip_id = run_write(insert_tip)
+    except IntegrityError:
+        # the same link was posted while this request was running
+        if blob_sha:
+            run_write(lambda sess: collect_blob(sess, blob_sha, upload_path))
+        dup = db.session.execute(db.select(Tip.id).where(Tip.link_canon == link_canon)).scalar()
+        return redirect(url_for("home", lang=lang, tab=tab, dup=dup))
+    finally:
+        if upload_tmp:
+            discard_file(upload_tmp)
+    if tip_id is None and blob_sha:
+        run_write(lambda sess: collect_blob(sess, blob_sha, upload_path))
 
     return redirect(url_for("home", lang=lang, tab=tab))
 
@@ -564,87 +3236,61 @@ def api_vote():
     if kind not in ["like", "dislike"]:
         return jsonify({"ok": False, "code": "BAD_KIND"}), 400
 
-    tip = Tip.query.get(tip_id)
-    if not tip:
-        return jsonify({"ok": False, "code": "NOT_FOUND"}), 404
-
-    if tip.author_id == me.id:
-        return jsonify({"ok": False, "code": "SELF_VOTE"}), 400
-
-    existing_like = Like.query.filter_by(tip_id=tip.id, user_id=me.id).first()
-    existing_dislike = Dislike.query.filter_by(tip_id=tip.id, user_id=me.id).first()
-
-    delta_me = 0
-    delta_author = 0
-    removed = None
-    added = None
-
-    def reward_once(k: str) -> bool:
-        # Returns True if this is the first time this user ever gets reward for this tip+kind
-        r = VoteReward.query.filter_by(tip_id=tip.id, user_id=me.id, kind=k).first()
-        if r:
-            return False
-        db.session.add(VoteReward(tip_id=tip.id, user_id=me.id, kind=k))
-        return True
-
-    if kind == "like":
-        if existing_like:
-            # toggle off (no extra points)
-            db.session.delete(existing_like)
-            tip.likes_count = max(tip.likes_count - 1, 0)
-            removed = "like"
-        else:
-            # switch off dislike if exists
-            if existing_dislike:
-                db.session.delete(existing_dislike)
-                tip.dislikes_count = max(tip.dislikes_count - 1, 0)
-                removed = "dislike"
-
-            db.session.add(Like(tip_id=tip.id, user_id=me.id))
-            tip.likes_count += 1
-            added = "like"
-
-            # reward ONLY once per user per tip for "like"
-            if reward_once("like"):
-                delta_me += REWARD_LIKE_GIVEN
-                delta_author += REWARD_LIKE_RECEIVED
-
-    else:  # dislike
-        if existing_dislike:
-            db.session.delete(existing_dislike)
-            tip.dislikes_count = max(tip.dislikes_count - 1, 0)
-            removed = "dislike"
-        else:
-            # switch off like if exists (do not refund points; just counts)
-            if existing_like:
-                db.session.delete(existing_like)
-                tip.likes_count = max(tip.likes_count - 1, 0)
-                removed = "like"
-
-            db.session.add(Dislike(tip_id=tip.id, user_id=me.id))
-            tip.dislikes_count += 1
-            added = "dislike"
-
-            # reward ONLY once per user per tip for "dislike"
-            if reward_once("dislike"):
-                delta_me += REWARD_DISLIKE_GIVEN
-
-    author = User.query.get(tip.author_id)
-    if author and delta_author:
-        author.points = max(author.points + delta_author, 0)
-    if delta_me:
-        me.points = max(me.points + delta_me, 0)
+    result = run_write(lambda sess: apply_vote(sess, me, tip_id, kind))
+    if result is None:
+        return jsonify({"ok": False, "code": "BUSY"}), 409
+    return jsonify(result[0]), result[1]
+
+def apply_vote(sess, me: UserSnapshot, tip_id: int, kind: str):
+    # Returns (payload, status). Inline, a vote is the vote upsert, the tip's
+    # counter UPDATE and, when it earns points, the points UPDATE.
+    want = 1 if kind == "like" else -1
+    vote = cast_vote(tip_id, me.id, want)
+    if vote is None:
+        author_id = sess.execute(db.select(Tip.author_id).where(Tip.id == tip_id)).scalar()
+        if author_id is None:
+            return {"ok": False, "code": "NOT_FOUND"}, 404
+        return {"ok": False, "code": "SELF_VOTE"}, 400
+
+    # toggling off takes no points back, and switching sides only moves counts
+    added = kind if vote.value == want else None
+    removed = ("like" if vote.prev_value > 0 else "dislike") if vote.prev_value else None
+    rewarded = bool(vote.rewarded_now)
+    delta_me = (REWARD_LIKE_GIVEN if kind == "like" else REWARD_DISLIKE_GIVEN) if rewarded else 0
+    delta_author = REWARD_LIKE_RECEIVED if rewarded and kind == "like" else 0
+    d_likes = (vote.value == 1) - (vote.prev_value == 1)
+    d_dislikes = (vote.value == -1) - (vote.prev_value == -1)
+
+    if vote_buffer:
+        # hot tip/author rows are left to the buffer; only the voter's row is touched
+        row = sess.execute(db.select(Tip.author_id, Tip.likes_count, Tip.dislikes_count, Tip.tags)
+                           .where(Tip.id == tip_id)).first()
+        dl, dd = vote_buffer.pending(tip_id)
+        likes = max((row.likes_count or 0) + dl + d_likes, 0)
+        dislikes = max((row.dislikes_count or 0) + dd + d_dislikes, 0)
+        points = add_points({me.id: delta_me})
+        publish_event("vote", tip_id, {"id": tip_id, "l": likes, "d": dislikes})
+        after_commit(lambda: vote_buffer.add(tip_id, d_likes, d_dislikes, {row.author_id: delta_author}))
+    else:
+        row = bump_tip_counts(tip_id, d_likes, d_dislikes)
+        likes, dislikes = max(row.likes_count, 0), max(row.dislikes_count, 0)
+        points = add_points({me.id: delta_me, row.author_id: delta_author})
+    me_points = points.get(me.id, me.points)
 
-    db.session.commit()
+    after_commit(lambda: feed_cache.invalidate("hot"))
+    if added == "like" and rewarded:
+        tag_names = parse_tags(row.tags)
+        after_commit(lambda: trending_tags.record(tag_names, TREND_W_LIKE))
 
-    return jsonify({
+    return {
         "ok": True,
         "added": added,
         "removed": removed,
-        "likes": tip.likes_count,
-        "dislikes": tip.dislikes_count,
-        "me_points": me.points,
-    })
+        "rewarded": rewarded,
+        "likes": likes,
+        "dislikes": dislikes,
+        "me_points": me_points,
+    }, 200
 
 @app.post("/api/delete")
 def api_delete():
@@ -662,8 +3308,27 @@ def api_delete():
         return jsonify({"ok": False, "message": "Not found."}), 404
     if tip.author_id != me.id:
         return jsonify({"ok": False, "message": "Only the author can delete."}), 403
-    db.session.delete(tip)
-    db.session.commit()
+    blob_sha = tip.blob_sha
+    tag_names = parse_tags(tip.tags)
+
+    def delete_tip(sess):
+        sess.execute(db.delete(Vote).where(Vote.tip_id == tip_id))
+        clear_tip_tags([tip_id])
+        clear_title_bands([tip_id])
+        if not sess.execute(db.delete(Tip).where(Tip.id == tip_id)).rowcount:
+            return "gone"
+        if blob_sha:
+            release_blob(blob_sha)
+
+        def deleted():
+            feed_cache.invalidate()
+            tag_suggest.bump(tag_names, -1)
+        after_commit(deleted)
+        return "deleted"
+
+    result = run_write(delete_tip)
+    if result is None:
+        return jsonify({"ok": False, "message": "Busy, try again."}), 409
     return jsonify({"ok": True})
 
 @app.post("/api/checkin")
@@ -672,32 +3337,50 @@ def api_checkin():
     if not me:
         return jsonify({"ok": False, "code": "LOGIN_REQUIRED"}), 401
 
+    # Single conditional UPDATE: racing requests cannot both claim today.
     today = utc_day_str()
-    if me.last_checkin_day == today:
-        return jsonify({"ok": False, "code": "ALREADY"}), 200
-
-    if me.last_checkin_day:
-        try:
-            last = date.fromisoformat(me.last_checkin_day)
-            if last == (date.fromisoformat(today) - timedelta(days=1)):
-                me.checkin_streak = min(me.checkin_streak + 1, CHECKIN_MAX_STREAK)
-            else:
-                me.checkin_streak = 1
-        except Exception:
-            me.checkin_streak = 1
-    else:
-        me.checkin_streak = 1
-
-    me.last_checkin_day = today
+    yesterday = (date.fromisoformat(today) - timedelta(days=1)).isoformat()
     reward = random.randint(CHECKIN_MIN, CHECKIN_MAX)
-    me.points += reward
-    db.session.commit()
+    next_streak = db.func.coalesce(User.checkin_streak, 0) + 1
+    stmt = (
+        db.update(User)
+        .where(User.id == me.id, db.func.coalesce(User.last_checkin_day, "") != today)
+        .values(
+            checkin_streak=db.case(
+                (User.last_checkin_day == yesterday,
+                 db.case((next_streak > CHECKIN_MAX_STREAK, CHECKIN_MAX_STREAK), else_=next_streak)),
+                else_=1,
+            ),
+            last_checkin_day=today,
+            points=User.points + reward,
+        )
+    )
+
+    def claim(sess):
+        mark_user_changed(me.id)
+        if db.engine.dialect.update_returning:
+            row = sess.execute(stmt.returning(User.points, User.checkin_streak)).first()
+        else:
+            res = sess.execute(stmt)
+            row = None
+            if res.rowcount == 1:
+                row = sess.execute(db.select(User.points, User.checkin_streak).where(User.id == me.id)).first()
+        return ("ok", tuple(row)) if row else ("already", None)
+
+    result = run_write(claim)
+    if result is None:
+        return jsonify({"ok": False, "code": "BUSY"}), 409
+    if result[0] == "already":
+        return jsonify({"ok": False, "code": "ALREADY"}), 200
 
-    return jsonify({"ok": True, "reward": reward, "streak": me.checkin_streak, "me_points": me.points})
+    points, streak = result[1]
+    return jsonify({"ok": True, "reward": reward, "streak": streak, "me_points": points})
 
 if __name__ == "__main__":
-    port = int(os.getenv("PORT", "5050"))
-    app.run(host="0.0.0.0", port=port, debug=True)
+    # Serve from serve.py, as a guarded main script: while this file is
+    # __main__, every spawned thumbnail worker would re-run all of it.
+    sys.modules["app"] = sys.modules["__main__"]   # serve.py's import gets this module, not a second copy
+    runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), "serve.py"), run_name="__main__")
 
 
 def _init_visits():
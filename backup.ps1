@@ -5,6 +5,8 @@ $name = "pinpoint_backup_$ts.zip"
 
 $paths = @(
   "app.py",
+  "serve.py",
+  "thumbs.py",
   "templates",
   "static",
   "instance",
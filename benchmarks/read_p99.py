@@ -0,0 +1,124 @@
+"""Read latency while votes are being written, with and without the SQLite profile.
+
+"before" is SQLite's defaults (rollback journal, synchronous=FULL, no mmap,
+2 MB cache), which is what the app ran with before the SQLITE_* profile;
+"after" is the profile's defaults (WAL, synchronous=NORMAL, ...). Each
+profile gets a fresh file-backed database and separate processes: WRITERS
+voting as fast as they can and READERS timing GETs, for DURATION seconds.
+The feed cache is off so every read reaches the database:
+
+    python benchmarks/read_p99.py [--duration 20] [--path /api/feed?tab=hot]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROFILES = {
+    "before": {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL", "SQLITE_TEMP_STORE": "DEFAULT",
+               "SQLITE_MMAP_MB": "0", "SQLITE_CACHE_MB": "2"},
+    "after": {},
+}
+WRITERS = 2
+READERS = 2
+TIPS = 500
+VOTERS = 40
+
+
+def client(pinpoint, handle: str):
+    c = pinpoint.app.test_client()
+    assert c.post("/login", data={"handle": handle, "password": "pw"}).status_code == 302
+    return c
+
+
+def seed() -> None:
+    import app as pinpoint
+    author = client(pinpoint, "bench_author")
+    for i in range(TIPS):
+        r = author.post("/submit", data={"title": f"bench tip {i}", "link_url": f"https://bench.example/{i}",
+                                         "tags": f"t{i % 20},t{i % 7}"})
+        assert r.status_code == 302
+    for i in range(VOTERS):
+        client(pinpoint, f"bench_voter{i}")
+
+
+def wait_until(start: float) -> float:
+    # logins (password hashing) happen before this, outside the measured window
+    time.sleep(max(start - time.time(), 0))
+    return time.monotonic()
+
+
+def write(start: float, duration: float, seed_: int) -> dict:
+    import app as pinpoint
+    rng = random.Random(seed_)
+    voters = [client(pinpoint, f"bench_voter{i}") for i in range(seed_, VOTERS, WRITERS)]
+    with pinpoint.app.app_context():
+        tip_ids = [i for (i,) in pinpoint.db.session.execute(pinpoint.db.select(pinpoint.Tip.id))]
+    ok = failed = 0
+    end = wait_until(start) + duration
+    while time.monotonic() < end:
+        r = rng.choice(voters).post("/api/vote", data={"tip_id": rng.choice(tip_ids), "kind": "like"})
+        if r.status_code == 200 and r.json["ok"]:
+            ok += 1
+        else:
+            failed += 1
+    return {"votes": ok, "failed": failed}
+
+
+def read(start: float, duration: float, path: str) -> dict:
+    import app as pinpoint
+    c = client(pinpoint, "bench_reader")
+    ms = []
+    end = wait_until(start) + duration
+    while time.monotonic() < end:
+        t0 = time.perf_counter()
+        assert c.get(path).status_code == 200
+        ms.append((time.perf_counter() - t0) * 1000)
+    return {"ms": ms}
+
+
+def run(profile: str, duration: float, path: str) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp}/bench.db", FEED_CACHE_TTL="0", **PROFILES[profile])
+        me = [sys.executable, os.path.abspath(__file__)]
+        subprocess.run(me + ["seed"], env=env, check=True)
+        start = str(time.time() + 15)
+        procs = [subprocess.Popen(me + ["write", start, str(duration), str(i)], env=env, stdout=subprocess.PIPE)
+                 for i in range(WRITERS)]
+        procs += [subprocess.Popen(me + ["read", start, str(duration), path], env=env, stdout=subprocess.PIPE)
+                  for _ in range(READERS)]
+        results = [json.loads(p.communicate()[0]) for p in procs]
+    ms = sorted(x for r in results[WRITERS:] for x in r["ms"])
+    votes = sum(r["votes"] for r in results[:WRITERS])
+    failed = sum(r["failed"] for r in results[:WRITERS])
+    p99 = statistics.quantiles(ms, n=100, method="inclusive")[98]
+    print(f"{profile:<8}{path:<20}{len(ms):>7}{statistics.median(ms):>9.1f}{p99:>9.1f}{votes:>8}{failed:>8}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--duration", type=float, default=20)
+    ap.add_argument("--path", action="append", help="default: /api/feed?tab=hot and /")
+    args = ap.parse_args()
+    print(f"{'profile':<8}{'read':<20}{'reads':>7}{'p50 ms':>9}{'p99 ms':>9}{'votes':>8}{'failed':>8}")
+    for path in args.path or ["/api/feed?tab=hot", "/"]:
+        for profile in PROFILES:
+            run(profile, args.duration, path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "seed":
+        seed()
+    elif len(sys.argv) > 1 and sys.argv[1] == "write":
+        print(json.dumps(write(float(sys.argv[2]), float(sys.argv[3]), int(sys.argv[4]))))
+    elif len(sys.argv) > 1 and sys.argv[1] == "read":
+        print(json.dumps(read(float(sys.argv[2]), float(sys.argv[3]), sys.argv[4])))
+    else:
+        main()
@@ -0,0 +1,108 @@
+"""Search latency (p50/p99) and recall at 1M tips, per SEARCH_WINDOW.
+
+Builds a synthetic SQLite database once (Zipf-distributed words, so a few
+words match a large share of tips, as in real titles) and times search_ids()
+for several query shapes. "overlap" is how much of the first page ranked
+over every match (window 0) the windowed first page still has, i.e. what the
+window costs in relevance:
+
+    python benchmarks/search_p99.py [--tips 1000000] [--db /tmp/search-bench.db]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+VOCAB = 50000
+TAGS = 300
+WINDOWS = (0, 20000, 5000, 1000)   # 0 (rank every match) first: it is the reference for "found"
+QUERIES_PER_SHAPE = 100
+
+
+def zipf_words(rng: random.Random, n: int) -> list[str]:
+    # rank r is drawn with weight 1/r
+    return [f"w{int(VOCAB ** rng.random())}" for _ in range(n)]
+
+
+def build(path: str, tips: int) -> None:
+    import app as pinpoint   # creates the schema, FTS table and triggers
+    with pinpoint.app.app_context():
+        author = pinpoint.get_or_create_user("search_bench")
+        author_id = author.id
+    rng = random.Random(18)
+    start = datetime(2024, 1, 1)
+
+    def row(i):
+        created_at = start + timedelta(seconds=30 * i)
+        likes = int(rng.paretovariate(1.2)) - 1
+        return (" ".join(zipf_words(rng, rng.randint(5, 12)))[:140],
+                " ".join(zipf_words(rng, rng.randint(0, 30))),
+                ",".join(f"t{int(TAGS ** rng.random())}" for _ in range(rng.randint(0, 3))),
+                author_id, created_at.isoformat(sep=" "), likes,
+                pinpoint.calc_hot_rank(likes, 0, created_at))
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.executemany("INSERT INTO tip (title, note, tags, author_id, created_at, likes_count, hot_rank, "
+                     "dislikes_count) VALUES (?, ?, ?, ?, ?, ?, ?, 0)", (row(i) for i in range(tips)))
+    conn.commit()
+    conn.execute("INSERT INTO tip_fts(tip_fts) VALUES ('optimize')")
+    conn.commit()
+    conn.close()
+
+
+def queries(rng: random.Random) -> dict:
+    return {
+        "common word": [[f"w{rng.randint(1, 10)}"] for _ in range(QUERIES_PER_SHAPE)],
+        "mid word": [[f"w{rng.randint(100, 1000)}"] for _ in range(QUERIES_PER_SHAPE)],
+        "rare word": [[f"w{rng.randint(10000, VOCAB - 1)}"] for _ in range(QUERIES_PER_SHAPE)],
+        "2 common": [[f"w{rng.randint(1, 10)}", f"w{rng.randint(1, 10)}"] for _ in range(QUERIES_PER_SHAPE)],
+        "common+mid": [[f"w{rng.randint(1, 10)}", f"w{rng.randint(100, 1000)}"] for _ in range(QUERIES_PER_SHAPE)],
+    }
+
+
+def pct(ms: list, p: float) -> float:
+    return statistics.quantiles(ms, n=100, method="inclusive")[p - 1] if len(ms) > 1 else ms[0]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tips", type=int, default=1_000_000)
+    ap.add_argument("--db", default="/tmp/search-bench.db")
+    args = ap.parse_args()
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+    fresh = not os.path.exists(args.db)
+    if fresh:
+        t0 = time.perf_counter()
+        build(args.db, args.tips)
+        print(f"built {args.tips} tips in {time.perf_counter() - t0:.0f} s: {args.db}")
+    import app as pinpoint
+    assert pinpoint.search_fts, "FTS5 not available"
+
+    shapes = queries(random.Random(99))
+    print(f"{'query':<13}{'sort':<6}{'window':>8}{'p50 ms':>9}{'p99 ms':>9}{'overlap':>9}")
+    with pinpoint.app.app_context():
+        for shape, qs in shapes.items():
+            for sort in ("rel", "hot"):
+                exact = None
+                for window in WINDOWS:
+                    ms, pages = [], []
+                    for q in qs:
+                        t0 = time.perf_counter()
+                        pages.append(pinpoint.search_ids(q, sort, 0, window=window))
+                        ms.append((time.perf_counter() - t0) * 1000)
+                    exact = exact or pages
+                    overlap = statistics.mean(len(set(got) & set(want)) / len(want) if want else 1.0
+                                              for got, want in zip(pages, exact))
+                    print(f"{shape:<13}{sort:<6}{window or 'all':>8}{pct(ms, 50):>9.1f}{pct(ms, 99):>9.1f}"
+                          f"{overlap:>9.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Peak RSS and wall time of one thumbnail job, full decode vs open_scaled().
+
+Sources are made and each case is run in a fresh process, so ru_maxrss is
+that job's peak alone (Linux carries the parent's peak over into a child):
+
+    python benchmarks/thumb_decode.py
+"""
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SOURCES = [("jpeg", 4000, 3000), ("jpeg", 8000, 6000), ("jpeg", 12000, 9000), ("png", 4000, 3000)]
+MODES = ("full", "scaled")
+
+
+def make_source(path: str, fmt: str, w: int, h: int) -> None:
+    from PIL import Image, ImageDraw
+    im = Image.radial_gradient("L").resize((w, h)).convert("RGB")
+    draw = ImageDraw.Draw(im)
+    for x in range(0, w, max(w // 40, 1)):   # some detail, so the encoder can't flatten it
+        draw.line([(x, 0), (w - x, h)], fill=(x % 256, 80, 160), width=3)
+    im.save(path, "JPEG" if fmt == "jpeg" else "PNG", quality=90)
+
+
+def run_case(mode: str, path: str, out_dir: str) -> None:
+    import thumbs
+    from PIL import Image
+    t0 = time.perf_counter()
+    if mode == "full":
+        Image.MAX_IMAGE_PIXELS = None   # the baseline has no cap of its own
+        # what make_variants did before open_scaled(): decode everything, then shrink
+        with Image.open(path) as im:
+            im = im.convert("RGB")
+            im.thumbnail((max(thumbs.THUMB_WIDTHS), 10**6), Image.LANCZOS)
+            im.save(os.path.join(out_dir, "full.webp"), "WEBP", quality=thumbs.WEBP_QUALITY)
+    else:
+        thumbs.make_variants(path, out_dir, "scaled")
+    wall = time.perf_counter() - t0
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # KiB on Linux
+    print(f"{wall:.3f} {rss_mb:.1f}")
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'source':<18}{'mode':<8}{'wall s':>8}{'peak RSS MB':>13}")
+        for fmt, w, h in SOURCES:
+            path = os.path.join(tmp, f"{w}x{h}.{fmt}")
+            subprocess.run([sys.executable, __file__, "make", path, fmt, str(w), str(h)], check=True)
+            for mode in MODES:
+                out = subprocess.run([sys.executable, __file__, mode, path, tmp],
+                                     capture_output=True, text=True)
+                if out.returncode:
+                    result = out.stderr.strip().splitlines()[-1]
+                else:
+                    wall, rss = out.stdout.split()
+                    result = f"{wall:>8}{rss:>13}"
+                print(f"{fmt + f' {w}x{h}':<18}{mode:<8}{result}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 6 and sys.argv[1] == "make":
+        make_source(sys.argv[2], sys.argv[3], int(sys.argv[4]), int(sys.argv[5]))
+    elif len(sys.argv) == 4:
+        run_case(*sys.argv[1:])
+    else:
+        main()
@@ -0,0 +1,10 @@
+# Development server: python serve.py (python app.py hands over to it).
+# The thumbnail pool spawns its workers, and spawn re-runs the parent's main
+# script in each of them as __mp_main__; this one does nothing unless it is
+# __main__, so the workers import only thumbs.py and Pillow.
+import os
+
+if __name__ == "__main__":
+    from app import app
+
+    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "5050")), debug=True)
@@ -10,11 +10,11 @@
   modal.addEventListener("click",(e)=>{ if(e.target===modal) close(); });
   document.addEventListener("keydown",(e)=>{ if(e.key==="Escape") close(); });
 
-  document.querySelectorAll(".tip img.tipImg").forEach(t=>{
-    t.addEventListener("click",()=>{
-      img.src=t.dataset.full||t.src;
-      modal.classList.add("on");
-    });
+  document.addEventListener("click",(e)=>{
+    const t=e.target.closest(".tip img.tipImg");
+    if(!t) return;
+    img.src=t.dataset.full||t.src;
+    modal.classList.add("on");
   });
 
   async function del(btn){
@@ -27,5 +27,8 @@
     if(!j.ok){ alert(j.message||"Delete failed."); return; }
     tip.remove();
   }
-  document.querySelectorAll("button.delbtn").forEach(b=>b.addEventListener("click",()=>del(b)));
+  document.addEventListener("click",(e)=>{
+    const b=e.target.closest("button.delbtn");
+    if(b) del(b);
+  });
 })();
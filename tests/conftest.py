@@ -0,0 +1,66 @@
+import os
+import sys
+import tempfile
+import threading
+import uuid
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# app.py configures itself from the environment at import time. Point
+# TEST_DATABASE_URL at a scratch database (e.g. postgresql://...) to run the
+# suite there; rows are namespaced per run, so it can be reused.
+DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+if not DATABASE_URL:
+    DB_DIR = tempfile.mkdtemp(prefix="pinpoint-tests-")
+    DATABASE_URL = f"sqlite:///{DB_DIR}/test.db"
+os.environ["DATABASE_URL"] = DATABASE_URL
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as pinpoint  # noqa: E402
+
+RUN = uuid.uuid4().hex[:8]
+
+
+@pytest.fixture
+def app_module():
+    return pinpoint
+
+
+@pytest.fixture
+def unique():
+    # handles, titles and links that no earlier run against the same database used
+    return lambda name: f"{name}_{RUN}"
+
+
+@pytest.fixture
+def login():
+    def _login(handle: str):
+        client = pinpoint.app.test_client()
+        r = client.post("/login", data={"handle": handle, "password": "pw"})
+        assert r.status_code == 302
+        return client
+    return _login
+
+
+@pytest.fixture
+def count_statements():
+    def _count(fn, writer=False):
+        # Statements issued by this thread only; thumb/stream/trend workers share the engine.
+        # writer=True also counts SINGLE_WRITER's writer thread, which runs this thread's writes.
+        me = threading.get_ident()
+        seen = []
+
+        def listener(_conn, _cursor, statement, *_args):
+            if threading.get_ident() == me or (writer and threading.current_thread().name == "db-writer"):
+                seen.append(statement)
+
+        # every engine: SINGLE_WRITER reads through a separate read-only one
+        event.listen(Engine, "before_cursor_execute", listener)
+        try:
+            fn()
+        finally:
+            event.remove(Engine, "before_cursor_execute", listener)
+        return seen
+    return _count
@@ -0,0 +1,31 @@
+def test_resubmit_after_deleting_newest_keeps_archived_ids(app_module, login, unique):
+    pinpoint = app_module
+    db = pinpoint.db
+    author = login(unique("arch_author"))
+
+    def submit(title):
+        r = author.post("/submit", data={"title": unique(title), "link_url": f"https://arch.example/{unique(title)}"})
+        assert r.status_code == 302
+        with pinpoint.app.app_context():
+            return db.session.execute(db.select(pinpoint.Tip.id).where(pinpoint.Tip.title == unique(title))).scalar_one()
+
+    def archive(tip_id):
+        with pinpoint.app.app_context():
+            return pinpoint.run_write(lambda sess: pinpoint.archive_chunk(sess, [tip_id]))
+
+    old = submit("arch old")
+    newest = submit("arch newest")
+    assert archive(old) == 1
+    assert author.post(f"/api/delete?tip_id={newest}").json["ok"]
+
+    # SQLite without AUTOINCREMENT would hand the archived id out again here
+    again = submit("arch again")
+    assert again > newest
+    assert archive(again) == 1
+    with pinpoint.app.app_context():
+        rows = dict(db.session.execute(
+            db.select(pinpoint.ArchivedTip.id, pinpoint.ArchivedTip.title)
+            .where(pinpoint.ArchivedTip.id.in_([old, again]))
+        ).all())
+        assert rows == {old: unique("arch old"), again: unique("arch again")}
+        assert db.session.get(pinpoint.Tip, again) is None
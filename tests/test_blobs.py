@@ -0,0 +1,53 @@
+import io
+import os
+
+
+def test_reupload_racing_the_last_delete_keeps_its_file(app_module, login, unique, monkeypatch):
+    pinpoint = app_module
+    db = pinpoint.db
+    # no thumbnail jobs: they would finish on the writer thread during later tests
+    monkeypatch.setattr(pinpoint, "THUMB_QUEUE_MAX", 0)
+    author = login(unique("blob_author"))
+    content = unique("blob bytes").encode() * 64
+
+    def submit(title):
+        r = author.post("/submit", data={
+            "title": unique(title),
+            "link_url": f"https://blob.example/{unique(title)}",
+            "image_file": (io.BytesIO(content), "pic.txt"),
+        }, content_type="multipart/form-data")
+        assert r.status_code == 302
+        with pinpoint.app.app_context():
+            return db.session.execute(
+                db.select(pinpoint.Tip.id, pinpoint.Tip.upload_path).where(pinpoint.Tip.title == unique(title))).one()
+
+    first_id, path = submit("blob first")
+    stored = os.path.join(pinpoint.app.root_path, "static", path)
+    assert os.path.exists(stored)
+
+    # the only other tip goes away after the upload was read, before its tip is written
+    store_upload = pinpoint.store_upload
+
+    def delete_meanwhile(f):
+        result = store_upload(f)
+        assert author.post(f"/api/delete?tip_id={first_id}").json["ok"]
+        return result
+    with monkeypatch.context() as m:
+        m.setattr(pinpoint, "store_upload", delete_meanwhile)
+        second_id, second_path = submit("blob second")
+
+    assert second_path == path
+    with open(stored, "rb") as fh:
+        assert fh.read() == content
+    with pinpoint.app.app_context():
+        sha = os.path.splitext(os.path.basename(path))[0]
+        assert db.session.get(pinpoint.Blob, sha).refcount == 1
+
+    # cleaning up after a failed submit leaves a referenced blob alone...
+    with pinpoint.app.app_context():
+        assert pinpoint.run_write(lambda sess: pinpoint.collect_blob(sess, sha, path))
+    assert os.path.exists(stored)
+    # ...and the last delete takes the files with it
+    assert author.post(f"/api/delete?tip_id={second_id}").json["ok"]
+    assert not os.path.exists(stored)
+    assert not [n for n in os.listdir(pinpoint.UPLOAD_DIR) if n.startswith(".tmp-")]
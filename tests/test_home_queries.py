@@ -0,0 +1,26 @@
+def test_home_page_query_count(app_module, login, unique, count_statements):
+    pinpoint = app_module
+    author = login(unique("home_author"))
+    for i in range(5):
+        r = author.post("/submit", data={"title": unique(f"home {i}"), "link_url": f"https://home.example/{unique(i)}",
+                                         "tags": "ai"})
+        assert r.status_code == 302
+    viewer = login(unique("home_viewer"))
+    with pinpoint.app.app_context():
+        db = pinpoint.db
+        tip_id = db.session.execute(db.select(pinpoint.Tip.id).where(pinpoint.Tip.title == unique("home 0"))).scalar_one()
+        me = db.session.execute(db.select(pinpoint.User.id).where(pinpoint.User.handle == unique("home_viewer"))).scalar_one()
+    assert viewer.post("/api/vote", data={"tip_id": tip_id, "kind": "like"}).json["ok"]
+
+    def get_home():
+        assert viewer.get("/").status_code == 200
+
+    pinpoint.user_cache.invalidate(me)
+    pinpoint.feed_cache.invalidate()
+    pinpoint.trending_tags._top = (0.0, [])
+
+    # user, ranked ids, tips, viewer votes, trending tags
+    assert len(count_statements(get_home)) == 5
+    # warm: the tips of the cached page and the viewer's votes on them
+    assert len(count_statements(get_home)) == 2
+    assert len(count_statements(get_home)) == 2
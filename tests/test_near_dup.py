@@ -0,0 +1,30 @@
+import random
+
+
+def test_near_dup_found_past_many_band_collisions(app_module, login, unique):
+    pinpoint = app_module
+    db = pinpoint.db
+    login(unique("dup_author"))
+    rng = random.Random(unique("dup"))
+    while True:
+        h = rng.getrandbits(64)
+        if 16 <= h.bit_count() <= 48:
+            break
+    # same first band, every other band inverted: far apart, but all probed
+    decoy = h ^ (0xFFFF_FFFF_FFFF << 16)
+    near = h ^ 0b1011   # 3 bits off
+
+    def tip(title, phash):
+        bands = dict(zip(("phash_b0", "phash_b1", "phash_b2", "phash_b3"), pinpoint.phash_bands(phash)))
+        return pinpoint.Tip(title=title, author_id=author_id, phash=f"{phash:016x}", **bands)
+
+    with pinpoint.app.app_context():
+        author_id = db.session.execute(
+            db.select(pinpoint.User.id).where(pinpoint.User.handle == unique("dup_author"))).scalar_one()
+        db.session.add_all([tip(unique(f"dup decoy {i}"), decoy) for i in range(600)])
+        db.session.flush()
+        match = tip(unique("dup match"), near)
+        db.session.add(match)
+        db.session.commit()
+        assert pinpoint.find_near_dup(f"{h:016x}", match.id + 1) == match.id
+        assert pinpoint.find_near_dup(f"{h:016x}", match.id) is None
@@ -0,0 +1,34 @@
+import json
+
+
+def test_reopened_stream_replays_missed_events(app_module, login, unique):
+    pinpoint = app_module
+    db = pinpoint.db
+    author = login(unique("stream_author"))
+    voter = login(unique("stream_voter"))
+    title = unique("stream")
+    assert author.post("/submit", data={"title": title, "link_url": f"https://stream.example/{title}"}).status_code == 302
+    with pinpoint.app.app_context():
+        tip_id = db.session.execute(db.select(pinpoint.Tip.id).where(pinpoint.Tip.title == title)).scalar_one()
+        last = db.session.execute(db.select(db.func.max(pinpoint.StreamEvent.id))).scalar()
+
+    # while the page was between two streams
+    assert voter.post("/api/vote", data={"tip_id": tip_id, "kind": "like"}).json["ok"]
+    assert voter.post("/api/vote", data={"tip_id": tip_id, "kind": "dislike"}).json["ok"]
+
+    resp = pinpoint.app.test_client().get(f"/api/stream?ids={tip_id}", headers={"Last-Event-ID": str(last)})
+    assert resp.status_code == 200
+    chunks = (c.decode() for c in resp.response)
+    try:
+        assert next(chunks).startswith("retry:")
+        votes = []
+        while len(votes) < 2:
+            msg = next(chunks)
+            fields = dict(line.split(": ", 1) for line in msg.strip().split("\n"))
+            assert int(fields["id"]) > last
+            if fields["event"] == "vote":
+                votes.append(json.loads(fields["data"]))
+    finally:
+        resp.close()
+    assert [(v["id"], v["l"], v["d"]) for v in votes] == [(tip_id, 1, 0), (tip_id, 0, 1)]
+    assert pinpoint.stream_hub.client_count() == 0
@@ -0,0 +1,99 @@
+import multiprocessing
+import random
+
+import pytest
+
+PROCESSES = 4
+VOTERS = 8
+VOTES_PER_VOTER = 12
+
+
+def vote_storm(pinpoint, clients, tip_id, seed, results):
+    rng = random.Random(seed)
+    codes = []
+    for _ in range(VOTES_PER_VOTER):
+        for client in clients:
+            r = client.post("/api/vote", data={"tip_id": tip_id, "kind": rng.choice(["like", "dislike"])})
+            codes.append(r.status_code)
+    if pinpoint.vote_buffer:
+        pinpoint.vote_buffer.flush()   # forked children exit without running atexit
+    results.put(codes)
+
+
+def claim_checkin(client, results):
+    results.put(client.post("/api/checkin").json)
+
+
+def run_processes(target, args_for):
+    # Forked like gunicorn workers; each opens its own connections (see _drop_inherited_connections).
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    procs = [ctx.Process(target=target, args=(*args_for(i), results)) for i in range(PROCESSES)]
+    for p in procs:
+        p.start()
+    out = [results.get(timeout=120) for _ in procs]
+    for p in procs:
+        p.join(timeout=30)
+        assert p.exitcode == 0
+    return out
+
+
+def points_of(pinpoint, handles):
+    db = pinpoint.db
+    with pinpoint.app.app_context():
+        return dict(db.session.execute(db.select(pinpoint.User.handle, pinpoint.User.points)
+                                       .where(pinpoint.User.handle.in_(handles))).all())
+
+
+@pytest.mark.parametrize("write_behind", [False, True], ids=["inline", "write_behind"])
+def test_concurrent_votes_keep_counters_exact(app_module, login, unique, monkeypatch, write_behind):
+    pinpoint = app_module
+    # Write-behind: each process keeps its deltas until its final flush, so
+    # the processes' net deltas (possibly negative) land in any order.
+    monkeypatch.setattr(pinpoint, "vote_buffer", pinpoint.VoteBuffer(60_000, 10**6) if write_behind else None)
+    db = pinpoint.db
+    author_handle = unique(f"storm_author_{write_behind}")
+    author = login(author_handle)
+    title = unique(f"vote storm {write_behind}")
+    assert author.post("/submit", data={"title": title, "link_url": f"https://storm.example/{title}"}).status_code == 302
+    with pinpoint.app.app_context():
+        tip_id = db.session.execute(db.select(pinpoint.Tip.id).where(pinpoint.Tip.title == title)).scalar_one()
+    handles = [unique(f"storm_voter{i}_{write_behind}") for i in range(VOTERS)]
+    voters = [login(h) for h in handles]
+    before = points_of(pinpoint, [author_handle, *handles])
+
+    # every process votes as every voter, so the same (user, tip) rows race
+    codes = run_processes(vote_storm, lambda i: (pinpoint, voters, tip_id, i))
+    assert {c for batch in codes for c in batch} <= {200, 409}
+
+    after = points_of(pinpoint, [author_handle, *handles])
+    V = pinpoint.Vote
+    with pinpoint.app.app_context():
+        tip = db.session.get(pinpoint.Tip, tip_id)
+        likes = db.session.execute(db.select(db.func.count()).where(V.tip_id == tip_id, V.value == 1)).scalar()
+        dislikes = db.session.execute(db.select(db.func.count()).where(V.tip_id == tip_id, V.value == -1)).scalar()
+        rewards = {h: (bool(rl), bool(rd)) for h, rl, rd in db.session.execute(
+            db.select(pinpoint.User.handle, V.rewarded_like, V.rewarded_dislike)
+            .join(V, V.user_id == pinpoint.User.id).where(V.tip_id == tip_id)).all()}
+        assert (tip.likes_count, tip.dislikes_count) == (likes, dislikes)
+        # Postgres computes it in SQL (ln / ln 2), so allow for the last bit
+        assert tip.hot_rank == pytest.approx(pinpoint.calc_hot_rank(likes, dislikes, tip.created_at), rel=1e-12)
+
+    rewarded_likes = sum(rl for rl, _ in rewards.values())
+    assert after[author_handle] - before[author_handle] == pinpoint.REWARD_LIKE_RECEIVED * rewarded_likes
+    for h in handles:
+        rl, rd = rewards.get(h, (False, False))
+        assert after[h] - before[h] == pinpoint.REWARD_LIKE_GIVEN * rl + pinpoint.REWARD_DISLIKE_GIVEN * rd
+
+
+def test_concurrent_checkins_claim_once(app_module, login, unique):
+    pinpoint = app_module
+    handle = unique("storm_checkin")
+    client = login(handle)
+    before = points_of(pinpoint, [handle])[handle]
+
+    results = run_processes(claim_checkin, lambda i: (client,))
+    won = [r for r in results if r["ok"]]
+    assert len(won) == 1
+    assert all(r["code"] == "ALREADY" for r in results if not r["ok"])
+    assert points_of(pinpoint, [handle])[handle] == before + won[0]["reward"] == won[0]["me_points"]
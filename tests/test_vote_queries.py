@@ -0,0 +1,37 @@
+def test_vote_statement_count(app_module, login, unique, count_statements):
+    pinpoint = app_module
+    db = pinpoint.db
+    author = login(unique("votes_author"))
+    title = unique("votes")
+    r = author.post("/submit", data={"title": title, "link_url": f"https://votes.example/{title}", "tags": "ai"})
+    assert r.status_code == 302
+    voter = login(unique("votes_voter"))
+    with pinpoint.app.app_context():
+        tip_id = db.session.execute(db.select(pinpoint.Tip.id).where(pinpoint.Tip.title == title)).scalar_one()
+    pinpoint.trending_tags.flush()   # nothing else of ours on the writer thread meanwhile
+
+    def vote(kind, **expect):
+        out = {}
+
+        def post():
+            out.update(voter.post("/api/vote", data={"tip_id": tip_id, "kind": kind}).json)
+        # warm the viewer's cached user row; only the vote itself is counted
+        assert voter.get("/").status_code == 200
+        n = len(count_statements(post, writer=True))
+        assert {k: out[k] for k in expect} == expect
+        return n
+
+    # vote upsert, tip counters (+ hot_rank, tag copies, stream event by trigger), points
+    assert vote("like", added="like", rewarded=True, likes=1) == 3
+    # withdrawn and switched votes earn nothing, so points are left alone
+    assert vote("like", added=None, removed="like", likes=0) == 2
+    assert vote("dislike", added="dislike", rewarded=True, dislikes=1) == 3
+    assert vote("like", added="like", removed="dislike", rewarded=False, likes=1, dislikes=0) == 2
+
+    with pinpoint.app.app_context():
+        tip = db.session.get(pinpoint.Tip, tip_id)
+        copies = db.session.execute(db.select(pinpoint.TipTag.hot_rank).where(pinpoint.TipTag.tip_id == tip_id)).scalars()
+        assert set(copies) == {tip.hot_rank}
+        events = db.session.execute(db.select(pinpoint.StreamEvent.data).where(
+            pinpoint.StreamEvent.tip_id == tip_id, pinpoint.StreamEvent.kind == "vote")).scalars().all()
+        assert len(events) == 4
@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+# Image work for the thumbnail pool. Kept free of Flask/DB imports so pool
+# processes (spawned, not forked) import only Pillow. Spawn also re-runs the
+# parent's main script in each of them, so that script must be guarded: the
+# pool's parent is gunicorn, flask or serve.py, never app.py as __main__.
+import os
+import warnings
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+try:
+    import pillow_avif  # noqa: F401  (AVIF plugin for Pillow builds without it)
+except ImportError:
+    pass
+
+THUMB_WIDTHS = (160, 320, 480, 960)
+FALLBACK_SIDE = 480          # legacy JPEG thumb (thumb_path)
+WEBP_QUALITY = 80
+AVIF_QUALITY = 60
+JPEG_QUALITY = 85
+REDUCING_GAP = 2.0           # reduce() by integer factors first, LANCZOS only for the last <2x
+MAX_PIXELS = int(os.environ.get("THUMB_MAX_PIXELS", "40000000"))   # decoded, i.e. after draft()
+DRAFT_MAX_REDUCTION = 8      # libjpeg decodes at down to 1/8 per side
+MAX_SOURCE_PIXELS = MAX_PIXELS * DRAFT_MAX_REDUCTION ** 2   # largest JPEG that can draft under MAX_PIXELS
+
+# Pillow checks the declared size at open(), before draft() can shrink a
+# JPEG, so open_scaled() does the real checks; Pillow's (a hard error above 2x
+# its limit, a warning below) only backstops the largest size any source may
+# declare.
+Image.MAX_IMAGE_PIXELS = MAX_SOURCE_PIXELS // 2
+warnings.simplefilter("ignore", Image.DecompressionBombWarning)
+
+# Errors that retrying will not fix.
+PERMANENT_ERRORS = (UnidentifiedImageError, Image.DecompressionBombError)
+
+_SWAPS_AXES = (5, 6, 7, 8)   # EXIF orientations that rotate by 90/270
+
+
+def avif_supported() -> bool:
+    Image.init()
+    return "AVIF" in Image.SAVE
+
+
+def _check_pixels(im: Image.Image, w: int, h: int) -> None:
+    if w * h > MAX_PIXELS:
+        im.close()
+        raise Image.DecompressionBombError(f"{w}x{h} exceeds {MAX_PIXELS} decoded pixels")
+
+
+def open_scaled(src_abs: str, max_w: int) -> tuple[Image.Image, int, int]:
+    # Decodes just enough pixels for a max_w-wide, upright RGB image.
+    # Returns (image, original width, original height), both oriented.
+    # MAX_PIXELS caps what is decoded: a JPEG's size after draft(), any
+    # other format's declared size.
+    im = Image.open(src_abs)
+    w, h = im.size
+    if im.format != "JPEG":
+        _check_pixels(im, w, h)
+    if getattr(im, "n_frames", 1) > 1:
+        im.seek(0)   # animated GIF/WebP: first frame only
+
+    orientation = im.getexif().get(0x0112, 1)
+    if orientation in _SWAPS_AXES:
+        w, h = h, w
+    scale = min(max_w / w, 1.0)
+
+    # JPEG: let libjpeg decode at 1/2, 1/4 or 1/8 scale (never below the request)
+    if im.format == "JPEG" and scale < 1.0:
+        want = (max(int(w * scale), 1), max(int(h * scale), 1))
+        if orientation in _SWAPS_AXES:
+            want = want[::-1]
+        im.draft("RGB", want)
+    if im.format == "JPEG":
+        _check_pixels(im, *im.size)
+
+    im = ImageOps.exif_transpose(im)
+    if im.mode != "RGB":
+        im = im.convert("RGB")
+    tw = min(max_w, w)
+    if im.width > tw:
+        im = im.resize((tw, max(round(h * tw / w), 1)), Image.LANCZOS, reducing_gap=REDUCING_GAP)
+    return im, w, h
+
+
+def dhash(im: Image.Image) -> int:
+    # 64-bit difference hash: 9x8 grayscale, one bit per horizontal neighbour
+    # pair. Survives recompression, rescaling and small crops.
+    px = im.convert("L").resize((9, 8), Image.LANCZOS, reducing_gap=REDUCING_GAP).tobytes()
+    bits = 0
+    for y in range(8):
+        for x in range(8):
+            bits = (bits << 1) | (px[y * 9 + x] > px[y * 9 + x + 1])
+    return bits
+
+
+def make_variants(src_abs: str, out_dir: str, stem: str, widths=THUMB_WIDTHS) -> dict:
+    # Writes <stem>.jpg (fallback) plus <stem>-<w>.webp / .avif for each width
+    # not larger than the source, and returns what was written plus the dHash.
+    fmts = (["avif"] if avif_supported() else []) + ["webp"]
+    im, w, h = open_scaled(src_abs, max(widths))
+
+    targets = sorted({min(tw, w) for tw in widths})
+    fallback = None
+    current = im
+    for tw in reversed(targets):
+        th = max(round(h * tw / w), 1)
+        # step down from the previous (larger) variant instead of the original
+        if current.size != (tw, th):
+            current = current.resize((tw, th), Image.LANCZOS, reducing_gap=REDUCING_GAP)
+        for fmt in fmts:
+            path = os.path.join(out_dir, f"{stem}-{tw}.{fmt}")
+            if fmt == "webp":
+                current.save(path, "WEBP", quality=WEBP_QUALITY, method=4)
+            else:
+                current.save(path, "AVIF", quality=AVIF_QUALITY)
+        if max(current.size) >= min(FALLBACK_SIDE, max(w, h)):
+            fallback = current
+
+    fallback = fallback.copy()
+    fallback.thumbnail((FALLBACK_SIDE, FALLBACK_SIDE), Image.LANCZOS, reducing_gap=REDUCING_GAP)
+    fallback.save(os.path.join(out_dir, f"{stem}.jpg"), "JPEG", quality=JPEG_QUALITY, optimize=True)
+
+    top = targets[-1]
+    return {"w": top, "h": max(round(h * top / w), 1), "widths": targets, "fmts": fmts,
+            "dhash": f"{dhash(im):016x}"}